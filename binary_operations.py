@@ -1,6 +1,10 @@
 # 建立 binary_operations.py → 二進位處理模組
 # MSB 提取、整數與二進位轉換
 
+import numpy as np
+
+__all__ = ['get_msbs', 'get_msbs_from_sums', 'int_to_binary', 'binary_to_int', 'pack_bits', 'unpack_bits']
+
 def get_msbs(numbers):
     """
     功能:
@@ -14,11 +18,33 @@ def get_msbs(numbers):
     
     原理:
         十進位若 < 128 則 MSB = 0，否則 MSB = 1
+        等同於把 8 位元數字右移 7 位（一次向量化位移處理全部數字）
     
     範例:
         [100, 200, 50, 180] → [0, 1, 0, 1]
     """
-    msbs = [1 if num >= 128 else 0 for num in numbers]
+    msbs = (np.asarray(numbers, dtype=np.uint8) >> 7).tolist()
+    return msbs
+
+def get_msbs_from_sums(sums, thresholds):
+    """
+    功能:
+        由像素總和直接判斷平均值的 MSB（不需先除成平均值）
+    
+    參數:
+        sums: 像素總和（numpy array）
+        thresholds: 每個總和對應的門檻（128 × 像素數），可廣播到 sums 的形狀
+    
+    返回:
+        msbs: 與 sums 形狀相同的 uint8 numpy array
+    
+    原理:
+        平均值 = 總和 ÷ 像素數，取整數後 ≥ 128 ⇔ 總和 ≥ 128 × 像素數
+    
+    範例:
+        sums = [511, 512, 8192], thresholds = [512, 512, 8192] → [0, 1, 1]
+    """
+    msbs = (np.asarray(sums) >= thresholds).astype(np.uint8)
     return msbs
 
 # ==================== 以下為 main.py 使用 ====================
@@ -41,9 +67,12 @@ def int_to_binary(number, bit_length=8):
     用途:
         展示二進位轉換過程
     """
-    binary_str = bin(number)[2:]               # 去掉開頭的 '0b'，例如 bin(65) = '0b1000001' → '1000001'
-    binary_str = binary_str.zfill(bit_length)  # 不夠長就在前面補 0，例如 '1000001' → '01000001'
-    binary = [int(bit) for bit in binary_str]  # 轉成數字列表，例如 '01000001' → [0,1,0,0,0,0,0,1]
+    number = int(number)
+    bit_length = max(bit_length, number.bit_length())                    # 數字超過位數時保留完整位元（同 zfill 行為）
+    num_bytes = (bit_length + 7) // 8
+    raw = np.frombuffer(number.to_bytes(num_bytes, 'big'), dtype=np.uint8)  # 例如 65 → b'\x41'
+    bits = np.unpackbits(raw)[-bit_length:]                               # 展開成位元，只保留最後 bit_length 位
+    binary = bits.tolist()                                                # 例如 [0,1,0,0,0,0,0,1]
     return binary
 
 def binary_to_int(binary):
@@ -64,6 +93,44 @@ def binary_to_int(binary):
     用途:
         展示 Z 碼轉像素值
     """
-    binary_str = ''.join(str(bit) for bit in binary)   # 列表轉字串，例如 [1,0,1] → '101'
-    number = int(binary_str, 2)                        # 二進位字串轉十進位，例如 '101' → 5
+    bits = np.asarray(binary, dtype=np.uint8)
+    padding = (-len(bits)) % 8                                             # 前面補 0 到 8 的倍數，例如 [1,0,1] → [0,0,0,0,0,1,0,1]
+    if padding:
+        bits = np.concatenate([np.zeros(padding, dtype=np.uint8), bits])
+    number = int.from_bytes(np.packbits(bits).tobytes(), 'big')            # 每 8 bits 打包成 1 byte，再轉成整數，例如 → 5
     return number
+
+def pack_bits(bits):
+    """
+    功能:
+        把位元序列打包成 bytes（每 8 bits 1 個 byte，不足 8 bits 的尾端補 0）
+    
+    參數:
+        bits: 位元列表或 numpy array
+    
+    返回:
+        data: 打包後的 bytes
+    
+    範例:
+        [0,1,0,0,1,0,0,0, 1,0,1] → b'\x48\xa0'
+    """
+    data = np.packbits(np.asarray(bits, dtype=np.uint8)).tobytes()
+    return data
+
+def unpack_bits(data, num_bits):
+    """
+    功能:
+        把 pack_bits 打包的 bytes 還原成位元陣列
+    
+    參數:
+        data: bytes 或 bytearray
+        num_bits: 原始位元數（用於去除尾端補齊的 0）
+    
+    返回:
+        bits: uint8 numpy array，長度為 num_bits
+    
+    範例:
+        (b'\x48\xa0', 11) → [0,1,0,0,1,0,0,0, 1,0,1]
+    """
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8))[:num_bits]
+    return bits
@@ -25,6 +25,12 @@ TOTAL_AVERAGES_PER_UNIT = NUM_LAYER1_BLOCKS + NUM_LAYER2_BLOCKS + NUM_LAYER3_BLO
 Q_LENGTH = 7                                    # Q 的長度(從圖像第一行取 7 個像素)
 Q_ROUNDS = TOTAL_AVERAGES_PER_UNIT // Q_LENGTH  # 重複使用輪數: 21÷7=3
 
+# XOR 加密密鑰流演算法（嵌入和提取必須使用相同設定）
+# 'sha256'   : SHA-256 重複 hash 串接（預設，與既有 Z 碼相容）
+# 'shake_128': SHAKE-128 一次產生任意長度的密鑰流（較快，但與 'sha256' 產生的 Z 碼不相容）
+# 'blake3'   : BLAKE3 一次產生任意長度的密鑰流（需安裝 blake3 套件，同樣與 'sha256' 不相容）
+KEYSTREAM_ALGORITHM = 'sha256'
+
 # 測試資料 (論文的圖 2)
 TEST_IMAGE = [
     [44, 61, 72, 58, 70, 79, 66, 79],
@@ -1,16 +1,163 @@
 # 建立 embed.py → 嵌入模組
 # 將機密內容嵌入載體圖像，產生 Z 碼
 
+import os
 import numpy as np
-import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
 from config import Q_LENGTH, TOTAL_AVERAGES_PER_UNIT, BLOCK_SIZE
-from permutation import generate_Q_from_block, apply_Q_three_rounds
-from image_processing import calculate_hierarchical_averages
-from binary_operations import get_msbs
+from permutation import generate_Q_batch, apply_Q_three_rounds_batched
+from image_processing import rgb_to_gray, split_into_blocks, calculate_image_sums, HIERARCHICAL_THRESHOLDS
+from binary_operations import get_msbs_from_sums, pack_bits
 from mapping import map_to_z
 from secret_encoding import text_to_binary, image_to_binary, xor_cipher
 
+# numba 為選用套件：有安裝時區塊計算編譯成單一平行迴圈，否則使用 numpy 分段處理
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# 區塊分段大小：每段的中間陣列約 1 MB，可留在 CPU 快取中；超過一段時以多執行緒平行處理
+BLOCKS_PER_CHUNK = 8192
+
+# 核心迴圈只依賴區塊數，內層 8×8 / 21 / 7 的迴圈範圍本來就是常數，
+# 不需要依載體尺寸產生特化版本
+# 明確指定參數型別：模組載入時就完成編譯（不等到第一次嵌入／提取），
+# cache=True 會把編譯結果存到磁碟，之後啟動直接載入，不必重新編譯
+if NUMBA_AVAILABLE:
+    @njit('void(uint8[:, :, ::1], int64[:, ::1], uint8[:, ::1])', parallel=True, cache=True)
+    def _block_msbs_kernel(blocks, q_index, msbs):
+        """
+        功能:
+            calculate_block_msbs 的 numba 版本，逐區塊計算平均值、套用排列並取 MSB
+        
+        參數:
+            blocks: 形狀 (N, 8, 8) 的 uint8 灰階區塊
+            q_index: 形狀 (N, 7) 的排列索引（Q - 1，從 0 開始）
+            msbs: 形狀 (N, 21) 的 uint8 輸出陣列
+        
+        原理:
+            平均值 ≥ 128 ⇔ 總和 ≥ 128 × 像素數，直接比較總和，不做除法：
+            2×2 總和 ≥ 512、4×4 總和 ≥ 2048、8×8 總和 ≥ 8192，結果與 numpy 版本一致
+        """
+        for n in prange(blocks.shape[0]):
+            bits = np.empty(21, dtype=np.uint8)
+            total = 0
+            
+            for gi in range(2):                 # 第二層 4 個分組（2×2）
+                for gj in range(2):
+                    group_sum = 0
+                    for ci in range(2):         # 分組內 4 個 2×2 區塊
+                        for cj in range(2):
+                            i = gi * 2 + ci
+                            j = gj * 2 + cj
+                            cell_sum = np.int64(0)             # 以 int64 累加，避免 uint8 溢位
+                            cell_sum += blocks[n, 2 * i, 2 * j]
+                            cell_sum += blocks[n, 2 * i, 2 * j + 1]
+                            cell_sum += blocks[n, 2 * i + 1, 2 * j]
+                            cell_sum += blocks[n, 2 * i + 1, 2 * j + 1]
+                            bits[i * 4 + j] = cell_sum >= 512          # 第一層
+                            group_sum += cell_sum
+                    bits[16 + gi * 2 + gj] = group_sum >= 2048     # 第二層
+                    total += group_sum
+            bits[20] = total >= 8192                                   # 第三層
+            
+            # 3 輪排列（每輪 7 個）
+            for r in range(3):
+                for k in range(7):
+                    msbs[n, r * 7 + k] = bits[r * 7 + q_index[n, k]]
+
+# 區塊 MSB 計算（numba 版）
+def calculate_block_msbs(blocks, contact_key=None):
+    """
+    功能:
+        計算多個 8×8 區塊排列後的 21 個 MSB（只在有安裝 numba 時使用）
+    
+    參數:
+        blocks: 形狀 (N, 8, 8) 的 uint8 灰階區塊
+        contact_key: 對象專屬密鑰（字串），用於生成 Q
+    
+    返回:
+        msbs: 形狀 (N, 21) 的 uint8 numpy array
+    
+    流程:
+        1. 生成每個區塊專屬的排列密鑰 Q（基於區塊內容 + contact_key）
+        2. 計算每個區塊的 21 個多層次像素總和
+        3. 由總和直接判斷 MSB（平均值 ≥ 128 ⇔ 總和 ≥ 128 × 像素數，不做除法）
+        4. 用 Q 重新排列 21 個 MSB（分 3 輪，每輪 7 個）
+    
+    平行處理:
+        步驟 2～4 由 _block_msbs_kernel 以 prange 平行處理
+        （Q 仍由 numpy 生成，確保相同像素值時的排序結果一致）
+        沒有 numba 時由 calculate_image_msbs 直接在圖像上分段計算，不經過此函式
+    """
+    blocks = np.ascontiguousarray(blocks, dtype=np.uint8)
+    msbs = np.empty((len(blocks), TOTAL_AVERAGES_PER_UNIT), dtype=np.uint8)
+    
+    Q = generate_Q_batch(blocks, Q_LENGTH, contact_key=contact_key)
+    _block_msbs_kernel(blocks, np.ascontiguousarray(Q - 1, dtype=np.int64), msbs)
+    
+    return msbs
+
+def calculate_image_msbs(cover_image, num_blocks, contact_key=None, fast_gray=False):
+    """
+    功能:
+        直接從載體圖像計算前 num_blocks 個 8×8 區塊排列後的 21 個 MSB
+    
+    參數:
+        cover_image: 灰階圖像 (H×W) 或彩色圖像 (H×W×3)，H 和 W 必須是 8 的倍數
+        num_blocks: 需要的區塊數（區塊順序先橫向再縱向）
+        contact_key: 對象專屬密鑰（字串），用於生成 Q
+        fast_gray: 彩色轉灰階是否使用整數近似（見 rgb_to_gray）
+    
+    返回:
+        msbs: 形狀 (num_blocks, 21) 的 uint8 numpy array，與 calculate_block_msbs 的結果相同
+    
+    原理:
+        不先用 split_into_blocks 把像素複製成 (N, 8, 8)：
+        Q 只需要每個區塊的第一行（即圖像每 8 列的第一列），
+        多層次總和由 calculate_image_sums 直接在圖像視圖上計算
+        彩色圖像不先整張轉灰階，每段區塊列各自轉換後立刻計算總和，
+        灰階暫存只有一段大小（可留在 CPU 快取中），用不到的區塊列也不會被轉換
+        超過 BLOCKS_PER_CHUNK 個區塊時，以整列區塊為單位分段交給多個執行緒
+        有安裝 numba 時，仍切成區塊交給 calculate_block_msbs 的編譯核心
+    """
+    cover_image = np.asarray(cover_image)
+    num_cols = cover_image.shape[1] // BLOCK_SIZE
+    rows_needed = -(-num_blocks // num_cols)
+    
+    if NUMBA_AVAILABLE:
+        gray_image = rgb_to_gray(cover_image[:rows_needed * BLOCK_SIZE], fast=fast_gray)
+        blocks = split_into_blocks(gray_image, num_blocks, BLOCK_SIZE)
+        return calculate_block_msbs(blocks, contact_key=contact_key)
+    
+    rows_per_chunk = max(1, BLOCKS_PER_CHUNK // num_cols)
+    msbs = np.empty((rows_needed * num_cols, TOTAL_AVERAGES_PER_UNIT), dtype=np.uint8)
+    
+    def process_strip(row_start):
+        row_end = min(row_start + rows_per_chunk, rows_needed)
+        strip = rgb_to_gray(cover_image[row_start * BLOCK_SIZE:row_end * BLOCK_SIZE], fast=fast_gray)
+        
+        # 每個區塊的第一行排成 (區塊數, 1, 8)，generate_Q_batch 只會讀取第一行
+        first_rows = strip[::BLOCK_SIZE].reshape(-1, 1, BLOCK_SIZE)
+        Q = generate_Q_batch(first_rows, Q_LENGTH, contact_key=contact_key)
+        sums = calculate_image_sums(strip)
+        block_msbs = get_msbs_from_sums(sums, HIERARCHICAL_THRESHOLDS)
+        msbs[row_start * num_cols:row_end * num_cols] = apply_Q_three_rounds_batched(block_msbs, Q)
+    
+    starts = range(0, rows_needed, rows_per_chunk)
+    
+    if len(starts) <= 1:
+        for start in starts:
+            process_strip(start)
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(starts), os.cpu_count() or 1)) as executor:
+            list(executor.map(process_strip, starts))
+    
+    return msbs[:num_blocks]
+
 # 載體容量計算
 def calculate_capacity(image_width, image_height):
     """
@@ -33,7 +180,7 @@ def calculate_capacity(image_width, image_height):
     return capacity
 
 # 嵌入
-def embed_secret(cover_image, secret, secret_type='text', contact_key=None):
+def embed_secret(cover_image, secret, secret_type='text', contact_key=None, fast_gray=False, return_format='bits'):
     """
     功能:
         將機密內容嵌入載體圖像，產生 Z 碼
@@ -43,11 +190,18 @@ def embed_secret(cover_image, secret, secret_type='text', contact_key=None):
         secret: 機密內容（字串或 PIL Image）
         secret_type: 'text' 或 'image'
         contact_key: 對象專屬密鑰（字串），用於加密
+        fast_gray: 彩色轉灰階是否使用整數近似（較快，但提取時必須使用相同設定）
+        return_format: 'bits'（預設）或 'bytes'
     
     返回:
-        z_bits: Z 碼位元列表
-        capacity: 載體圖像的總容量（bits）
-        info: 額外資訊（機密內容的相關資訊）
+        return_format='bits':
+            z_bits: Z 碼位元陣列（uint8 numpy array，每個元素 0 或 1）
+            capacity: 載體圖像的總容量（bits）
+            info: 額外資訊（機密內容的相關資訊）
+        return_format='bytes':
+            z_bytes: 每 8 bits 打包成 1 byte 的 Z 碼（尾端補 0）
+            num_bits: Z 碼位元數
+            capacity, info: 同上
     
     流程:
         1. 圖像預處理（彩色轉灰階、檢查尺寸）
@@ -59,19 +213,15 @@ def embed_secret(cover_image, secret, secret_type='text', contact_key=None):
         [1 bit 類型標記] + [機密內容]
         類型標記: 0 = 文字, 1 = 圖像
     """
-    cover_image = np.array(cover_image)
+    if return_format not in ('bits', 'bytes'):
+        raise ValueError(f"不支援的輸出格式: {return_format}")
     
-    # 步驟 1：圖像預處理
-    # 若為彩色圖像，轉成灰階（使用標準權重）
-    # len(shape) == 3 表示有 3 個維度（高, 寬, 通道），即彩色圖像
-    if len(cover_image.shape) == 3:
-        cover_image = (
-            0.299 * cover_image[:, :, 0] +  # R × 0.299
-            0.587 * cover_image[:, :, 1] +  # G × 0.587
-            0.114 * cover_image[:, :, 2]    # B × 0.114
-        ).astype(np.uint8)                  # 轉成整數 (0~255)
+    cover_image = np.asarray(cover_image)   # 已是 numpy array 時直接使用，不複製整張圖（之後只讀不寫）
     
-    height, width = cover_image.shape       # 取得圖像尺寸（高, 寬）
+    # 步驟 1：圖像預處理
+    # 彩色轉灰階（預設使用標準權重，fast_gray=True 時使用整數近似）延後到步驟 4，
+    # 只轉換用到的區塊列，並與多層次總和分段一起計算
+    height, width = cover_image.shape[:2]   # 取得圖像尺寸（高, 寬）
     
     # 檢查圖像大小是否為 8 的倍數（系統以 8×8 區塊處理）
     if height % 8 != 0 or width % 8 != 0:
@@ -90,18 +240,19 @@ def embed_secret(cover_image, secret, secret_type='text', contact_key=None):
     
     # 將機密內容轉成二進位（加入類型標記）
     if secret_type == 'text':
-        type_marker = [0]                      # 0 = 文字
-        content_bits = text_to_binary(secret)  # "Hi" → [0,1,0,0,1,0,0,0,...]
+        type_marker = np.array([0], dtype=np.uint8)  # 0 = 文字
+        content_bits = text_to_binary(secret)        # "Hi" → [0,1,0,0,1,0,0,0,...]
         info = {'type': 'text', 'length': len(secret), 'bits': len(content_bits) + 1}
     else:
-        type_marker = [1]                                   # 1 = 圖像
+        type_marker = np.array([1], dtype=np.uint8)         # 1 = 圖像
         content_bits, size, mode = image_to_binary(secret)  # PIL Image → 二進位
+        content_bits = np.asarray(content_bits, dtype=np.uint8)
         info = {'type': 'image', 'size': size, 'mode': mode, 'bits': len(content_bits) + 1}
     
     # 組合完整的 secret_bits
     # 例如文字 "H": [0] + [0,1,0,0,1,0,0,0] = [0,0,1,0,0,1,0,0,0]
     #              類型   內容
-    secret_bits = type_marker + content_bits
+    secret_bits = np.concatenate([type_marker, content_bits])
     
     # 檢查容量是否足夠
     if len(secret_bits) > capacity:
@@ -121,76 +272,35 @@ def embed_secret(cover_image, secret, secret_type='text', contact_key=None):
         image_header = content_bits[:IMAGE_HEADER_SIZE]   # 寬、高、色彩模式
         pixel_data = content_bits[IMAGE_HEADER_SIZE:]     # 像素資料
         encrypted_pixels = xor_cipher(pixel_data, contact_key)
-        encrypted_bits = type_marker + image_header + encrypted_pixels
+        encrypted_bits = np.concatenate([type_marker, image_header, encrypted_pixels])
     else:
         # 文字加密結構：
         # [type_marker 1 bit] + XOR([content_bits])
         #      不加密                  加密
         encrypted_content = xor_cipher(content_bits, contact_key)
-        encrypted_bits = type_marker + encrypted_content
+        encrypted_bits = np.concatenate([type_marker, encrypted_content])
     
-    # 步驟 4：對每個 8×8 區塊進行嵌入
-    # 遍歷每個區塊，產生 Z 碼
+    # 步驟 4：對需要的 8×8 區塊一次進行嵌入
     # 載體圖像分割示意（以 16×16 為例）：
     # ┌────┬────┐
-    # │ 0,0│ 0,1│  每格是 8×8 區塊
+    # │ 0,0│ 0,1│  每格是 8×8 區塊，依序（先橫向再縱向）編號 0, 1, 2, 3
     # ├────┼────┤
     # │ 1,0│ 1,1│
     # └────┴────┘
-    z_bits = []
-    secret_bit_index = 0
-    finished = False
+    # 每個區塊提供 21 個位置，只需處理前 ceil(位元數 / 21) 個區塊
+    # 例如 100 bits → 需要 5 個區塊（最後一個區塊只用到 16 個位置）
+    num_bits = len(encrypted_bits)
+    num_blocks_needed = -(-num_bits // TOTAL_AVERAGES_PER_UNIT)
     
-    for i in range(num_rows):      # i = 第幾列區塊
-        if finished:
-            break
-        
-        for j in range(num_cols):  # j = 第幾行區塊
-            if secret_bit_index >= len(encrypted_bits):
-                finished = True
-                break
-            
-            # 提取這個 8×8 區塊
-            # 例如 i=1, j=2 時：
-            # start_row = 1 × 8 = 8
-            # end_row = 8 + 8 = 16
-            # start_col = 2 × 8 = 16
-            # end_col = 16 + 8 = 24
-            # block = cover_image[8:16, 16:24]
-            start_row = i * BLOCK_SIZE
-            end_row = start_row + BLOCK_SIZE
-            start_col = j * BLOCK_SIZE
-            end_col = start_col + BLOCK_SIZE
-            block = cover_image[start_row:end_row, start_col:end_col]
-            
-            # 生成這個區塊專屬的排列密鑰 Q
-            # 每個區塊的 Q 都不同（基於區塊內容 + contact_key）
-            Q = generate_Q_from_block(block, Q_LENGTH, contact_key=contact_key)
-            
-            # 計算 21 個多層次平均值
-            # 第一層: 16 個 (2×2 區塊)
-            # 第二層: 4 個 (4×4 區塊)
-            # 第三層: 1 個 (8×8 整塊)
-            averages_21 = calculate_hierarchical_averages(block)
-            
-            # 用 Q 重新排列 21 個平均值（分 3 輪，每輪 7 個）
-            reordered_averages = apply_Q_three_rounds(averages_21, Q)
-            
-            # 提取排列後的 21 個 MSB (最高有效位元）
-            # 例如 156 = 10011100，MSB = 1
-            msbs = get_msbs(reordered_averages)
-            
-            # 映射產生 Z 碼
-            # 對這個區塊的 21 個位置，逐一產生 Z
-            for k in range(TOTAL_AVERAGES_PER_UNIT):  # k = 0~20
-                if secret_bit_index >= len(encrypted_bits):
-                    finished = True
-                    break
-                
-                secret_bit = encrypted_bits[secret_bit_index]  # 要嵌入的 bit
-                msb = msbs[k]                                  # 對應的 MSB
-                z_bit = map_to_z(secret_bit, msb)              # (M, MSB) → Z
-                z_bits.append(z_bit)
-                secret_bit_index += 1
+    # 計算每個區塊排列後的 21 個 MSB，依區塊順序攤平成一維
+    # （Q 生成 → 多層次像素總和 → 門檻比較取 MSB → 3 輪排列，直接在圖像上計算，不先切成區塊）
+    msbs = calculate_image_msbs(cover_image, num_blocks_needed, contact_key=contact_key, fast_gray=fast_gray).ravel()
+    
+    # 映射產生 Z 碼
+    # 第 i 個秘密位元對應第 i 個 MSB，最後一個區塊可能只用到部分位置
+    z_bits = map_to_z(encrypted_bits, msbs[:num_bits])  # (M, MSB) → Z，整串一次查表
+    
+    if return_format == 'bytes':
+        return pack_bits(z_bits), num_bits, capacity, info
     
     return z_bits, capacity, info
@@ -5,8 +5,6 @@ import numpy as np
 import math
 from PIL import Image
 
-from binary_operations import int_to_binary, binary_to_int
-
 # ==================== 基礎版（供 main.py 使用）====================
 def z_to_image(z_bits):
     """
@@ -14,7 +12,7 @@ def z_to_image(z_bits):
         將 Z 碼位元列表編碼成灰階圖像
     
     參數:
-        z_bits: Z 碼位元列表
+        z_bits: Z 碼位元列表或 numpy array
     
     返回:
         image: PIL Image（灰階）
@@ -25,32 +23,19 @@ def z_to_image(z_bits):
     範例:
         [0,1,0,0,1,0,0,0, 0,1,1,0,1,0,0,1] → 2 個像素 (72, 105)
     """
-    num_bits = len(z_bits)
-    num_pixels = math.ceil(num_bits / 8)
-    
-    # 補齊到 8 的倍數
-    if num_bits % 8 != 0:
-        padding = 8 - (num_bits % 8)
-        z_bits = z_bits + [0] * padding
-    
-    # 每 8 bits 轉成 1 個像素值
-    pixels = []
-    for i in range(0, len(z_bits), 8):
-        byte = z_bits[i:i+8]
-        pixel_value = binary_to_int(byte)
-        pixels.append(pixel_value)
+    # 每 8 bits 轉成 1 個像素值（np.packbits 會自動在尾端補 0 到 8 的倍數）
+    pixels = np.packbits(np.asarray(z_bits, dtype=np.uint8))
+    num_pixels = len(pixels)
     
     # 計算圖像尺寸（盡量接近正方形）
     width = int(math.sqrt(num_pixels))
     height = math.ceil(num_pixels / width)
     
     # 補齊像素數量
-    while len(pixels) < width * height:
-        pixels.append(0)
+    pixel_array = np.pad(pixels, (0, width * height - num_pixels))
     
     # 建立灰階圖像
-    pixel_array = np.array(pixels, dtype=np.uint8)
-    pixel_array = pixel_array[:width * height].reshape(height, width)
+    pixel_array = pixel_array.reshape(height, width)
     image = Image.fromarray(pixel_array, mode='L')
     
     return image
@@ -73,19 +58,17 @@ def image_to_z(image, original_bit_length=None):
     範例:
         2 個像素 (72, 105) → [0,1,0,0,1,0,0,0, 0,1,1,0,1,0,0,1]
     """
-    # 圖像轉成像素陣列
-    pixel_array = np.array(image)
-    pixels = pixel_array.flatten()
+    # 圖像轉成像素陣列（不複製）
+    pixels = np.asarray(image, dtype=np.uint8).ravel()
     
-    # 每個像素轉成 8 bits
-    z_bits = []
-    for pixel in pixels:
-        binary = int_to_binary(pixel, 8)
-        z_bits.extend(binary)
+    # 每個像素轉成 8 bits，一次展開全部像素
+    bits = np.unpackbits(pixels)
     
-    # 去除補齊的 0
+    # 去除補齊的 0（先在陣列上截斷，再轉成列表）
     if original_bit_length is not None:
-        z_bits = z_bits[:original_bit_length]
+        bits = bits[:original_bit_length]
+    
+    z_bits = bits.tolist()
     
     return z_bits
   
@@ -96,7 +79,7 @@ def z_to_image_with_header(z_bits, style_num, img_num, img_size):
         將 Z 碼編碼成灰階圖像（含 header 資訊）
     
     參數:
-        z_bits: Z 碼位元列表
+        z_bits: Z 碼位元列表或 numpy array
         style_num: 風格編號（1~5）
         img_num: 圖像編號（1~7）
         img_size: 圖像尺寸（64, 128, 256...）
@@ -113,27 +96,17 @@ def z_to_image_with_header(z_bits, style_num, img_num, img_size):
     """
     length = len(z_bits)
     
-    # 建立 header（72 bits）
-    header_bits = []
-    header_bits += int_to_binary(length, 32)    # Z碼長度: 32 bits
-    header_bits += int_to_binary(style_num, 8)  # 風格編號: 8 bits
-    header_bits += int_to_binary(img_num, 16)   # 圖像編號: 16 bits
-    header_bits += int_to_binary(img_size, 16)  # 圖像尺寸: 16 bits
-    
-    # 合併 header 和 Z碼
-    full_bits = header_bits + z_bits
-    
-    # 補齊到 8 的倍數
-    if len(full_bits) % 8 != 0:
-        padding = 8 - (len(full_bits) % 8)
-        full_bits = full_bits + [0] * padding
+    # 建立 header（72 bits = 9 bytes，欄位都落在完整的 byte 上，直接寫 bytes，不經過位元列表）
+    header = (
+        length.to_bytes(4, 'big') +          # Z碼長度: 32 bits
+        int(style_num).to_bytes(1, 'big') +  # 風格編號: 8 bits
+        int(img_num).to_bytes(2, 'big') +    # 圖像編號: 16 bits
+        int(img_size).to_bytes(2, 'big')     # 圖像尺寸: 16 bits
+    )
     
-    # 每 8 bits 轉成 1 個像素值
-    pixels = []
-    for i in range(0, len(full_bits), 8):
-        byte = full_bits[i:i+8]
-        pixel_value = binary_to_int(byte)
-        pixels.append(pixel_value)
+    # Z碼每 8 bits 轉成 1 個像素值（np.packbits 會自動在尾端補 0 到 8 的倍數），接在 header 後面
+    z_pixels = np.packbits(np.asarray(z_bits, dtype=np.uint8))
+    pixels = np.concatenate([np.frombuffer(header, dtype=np.uint8), z_pixels])
     
     # 計算圖像尺寸（盡量接近正方形）
     num_pixels = len(pixels)
@@ -141,12 +114,11 @@ def z_to_image_with_header(z_bits, style_num, img_num, img_size):
     height = math.ceil(num_pixels / width)
     
     # 補齊像素數量
-    while len(pixels) < width * height:
-        pixels.append(0)
+    pixel_array = np.zeros(width * height, dtype=np.uint8)
+    pixel_array[:num_pixels] = pixels
     
     # 建立灰階圖像
-    image = Image.new('L', (width, height))
-    image.putdata(pixels[:width * height])
+    image = Image.fromarray(pixel_array.reshape(height, width), mode='L')
     
     return image, length
 
@@ -159,7 +131,7 @@ def image_to_z_with_header(image):
         image: PIL Image（灰階或彩色，會自動轉灰階）
     
     返回:
-        z_bits: Z 碼位元列表
+        z_bits: Z 碼位元 uint8 numpy array
         style_num: 風格編號
         img_num: 圖像編號
         img_size: 圖像尺寸
@@ -171,30 +143,26 @@ def image_to_z_with_header(image):
     if image.mode != 'L':
         image = image.convert('L')
     
-    # 圖像轉成像素列表
-    pixels = list(image.getdata())
-    
-    # 每個像素轉成 8 bits
-    all_bits = []
-    for pixel in pixels:
-        bits = int_to_binary(pixel, 8)
-        all_bits.extend(bits)
+    # 圖像轉成像素陣列（每個像素 = 1 byte）
+    pixels = np.asarray(image, dtype=np.uint8).ravel()
     
-    # 檢查長度（至少需要 72 bits 的 header）
-    if len(all_bits) < 72:
+    # 檢查長度（至少需要 72 bits = 9 bytes 的 header）
+    if len(pixels) < 9:
         raise ValueError("Z碼圖格式錯誤：太小")
     
-    # 解析 header
-    z_length = binary_to_int(all_bits[:32])     # Z碼長度
-    style_num = binary_to_int(all_bits[32:40])  # 風格編號
-    img_num = binary_to_int(all_bits[40:56])    # 圖像編號
-    img_size = binary_to_int(all_bits[56:72])   # 圖像尺寸
+    # 解析 header（欄位都落在完整的 byte 上，直接讀 bytes）
+    header = pixels[:9].tobytes()
+    z_length = int.from_bytes(header[0:4], 'big')   # Z碼長度: bytes 0~3
+    style_num = header[4]                           # 風格編號: byte 4
+    img_num = int.from_bytes(header[5:7], 'big')    # 圖像編號: bytes 5~6
+    img_size = int.from_bytes(header[7:9], 'big')   # 圖像尺寸: bytes 7~8
     
     # 檢查 Z碼長度是否合理
-    if z_length <= 0 or z_length > len(all_bits) - 72:
+    if z_length <= 0 or z_length > (len(pixels) - 9) * 8:
         raise ValueError(f"無效的 Z碼（長度：{z_length}）")
     
-    # 提取 Z碼
-    z_bits = all_bits[72:72 + z_length]
+    # 提取 Z碼：只展開 Z 碼所在的像素，不處理後面補齊的部分
+    z_bytes = pixels[9:9 + (z_length + 7) // 8]
+    z_bits = np.unpackbits(z_bytes)[:z_length]
     
     return z_bits, style_num, img_num, img_size
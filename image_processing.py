@@ -3,6 +3,84 @@
 
 import numpy as np
 
+# numba 為選用套件：有安裝時單一區塊的平均值改用編譯後的迴圈計算
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+def rgb_to_gray(image, fast=False):
+    """
+    功能:
+        將彩色圖像轉成灰階（灰階圖像直接回傳）
+    
+    參數:
+        image: numpy array，灰階圖像 (H×W) 或彩色圖像 (H×W×3)
+        fast: 是否使用整數近似權重（預設 False）
+    
+    返回:
+        gray: 灰階圖像 (H×W)，uint8
+    
+    原理:
+        標準權重: 0.299×R + 0.587×G + 0.114×B，小數部分捨去
+        整數近似: (77×R + 150×G + 29×B + 128) >> 8，全程使用 uint16，不產生浮點陣列
+        
+        注意：整數近似約有一半的顏色會差 1，MSB 可能因此改變，
+             嵌入和提取必須使用相同設定，且與標準權重產生的 Z 碼不相容
+    """
+    image = np.asarray(image)
+    
+    # len(shape) == 3 表示有 3 個維度（高, 寬, 通道），即彩色圖像
+    if len(image.shape) != 3:
+        return image
+    
+    if fast:
+        r = image[:, :, 0].astype(np.uint16)
+        g = image[:, :, 1].astype(np.uint16)
+        b = image[:, :, 2].astype(np.uint16)
+        return ((77 * r + 150 * g + 29 * b + 128) >> 8).astype(np.uint8)
+    
+    # 就地累加，避免三個完整的浮點暫存陣列（運算順序與 R + G + B 相同，結果一致）
+    gray = 0.299 * image[:, :, 0]  # R × 0.299
+    gray += 0.587 * image[:, :, 1]  # G × 0.587
+    gray += 0.114 * image[:, :, 2]  # B × 0.114
+    return gray.astype(np.uint8)    # 轉成整數 (0~255)
+
+def split_into_blocks(image, num_blocks=None, block_size=8):
+    """
+    功能:
+        將灰階圖像切成 block_size × block_size 區塊，依序（先橫向再縱向）排成一維
+    
+    參數:
+        image: 灰階圖像 (H×W)，H 和 W 必須是 block_size 的倍數
+        num_blocks: 只取前幾個區塊（預設全部）
+        block_size: 區塊大小，預設 8
+    
+    返回:
+        blocks: 形狀 (num_blocks, block_size, block_size) 的 numpy array
+    
+    原理:
+        (H, W) → (區塊列數, 8, 區塊行數, 8) 的 4 維視圖 → 交換中間兩軸 → (區塊數, 8, 8)
+        只有用到的區塊列才會被複製，機密內容很小時不必處理整張圖
+    """
+    image = np.asarray(image)
+    height, width = image.shape
+    num_rows = height // block_size
+    num_cols = width // block_size
+    
+    if num_blocks is None:
+        num_blocks = num_rows * num_cols
+    
+    # 只取涵蓋前 num_blocks 個區塊所需的區塊列
+    rows_needed = min(num_rows, -(-num_blocks // num_cols))
+    strip = image[:rows_needed * block_size]
+    
+    blocks = strip.reshape(rows_needed, block_size, num_cols, block_size).swapaxes(1, 2)
+    blocks = blocks.reshape(rows_needed * num_cols, block_size, block_size)
+    
+    return blocks[:num_blocks]
+
 def calculate_hierarchical_averages(block_8x8):
     """
     功能:
@@ -24,6 +102,20 @@ def calculate_hierarchical_averages(block_8x8):
     """
     block_8x8 = np.array(block_8x8)
     
+    # 整數像素：平均值捨去小數 = 像素總和右移（÷4 → >>2、÷16 → >>4、÷64 → >>6），不需轉成浮點數
+    if block_8x8.dtype.kind in 'iu':
+        # 有 numba 時直接用編譯後的迴圈（省去 numpy reshape/sum 的呼叫開銷）
+        if NUMBA_AVAILABLE:
+            averages_21 = np.empty(21, dtype=np.int64)
+            _hierarchical_averages_kernel(block_8x8.astype(np.int64), averages_21)
+            return averages_21.tolist()
+        
+        layer1_sums = block_8x8.reshape(4, 2, 4, 2).sum(axis=(1, 3), dtype=np.int64)  # 16 個 2×2 總和
+        layer2_sums = layer1_sums.reshape(2, 2, 2, 2).sum(axis=(1, 3))                 # 4 個 4×4 總和
+        total = int(layer2_sums.sum())                                                 # 8×8 總和
+        averages_21 = (layer1_sums >> 2).flatten().tolist() + (layer2_sums >> 4).flatten().tolist() + [total >> 6]
+        return averages_21
+    
     # ========== 第一層: 16 個 2×2 區塊 ==========
     # 把 8×8 reshape 成 (4, 2, 4, 2)，對 axis 1 和 3 取平均
     reshaped = block_8x8.reshape(4, 2, 4, 2)
@@ -43,3 +135,94 @@ def calculate_hierarchical_averages(block_8x8):
     averages_21 = layer1_averages + layer2_averages + [layer3_average]
     
     return averages_21
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _hierarchical_averages_kernel(block, out):
+        """
+        功能:
+            calculate_hierarchical_averages 的 numba 版本（整數像素）
+        
+        參數:
+            block: 8×8 的 int64 numpy array
+            out: 長度 21 的 int64 輸出陣列
+        
+        原理:
+            每層平均值都是「原始像素總和 ÷ 像素數」再捨去小數，
+            因此用總和右移：2×2 總和 >> 2、4×4 總和 >> 4、8×8 總和 >> 6
+            （第二層不能用第一層捨去後的平均值再平均，否則結果會和 numpy 版本不同）
+        """
+        total = 0
+        for gi in range(2):                 # 第二層 4 個分組（2×2）
+            for gj in range(2):
+                group_sum = 0
+                for ci in range(2):         # 分組內 4 個 2×2 區塊
+                    for cj in range(2):
+                        i = gi * 2 + ci
+                        j = gj * 2 + cj
+                        cell_sum = (block[2 * i, 2 * j] + block[2 * i, 2 * j + 1] +
+                                    block[2 * i + 1, 2 * j] + block[2 * i + 1, 2 * j + 1])
+                        out[i * 4 + j] = cell_sum >> 2          # 第一層
+                        group_sum += cell_sum
+                out[16 + gi * 2 + gj] = group_sum >> 4          # 第二層
+                total += group_sum
+        out[20] = total >> 6                                    # 第三層
+
+# 各平均值的 MSB 門檻（以像素總和表示）：平均值 ≥ 128 ⇔ 總和 ≥ 128 × 像素數
+# 第一層 4 個像素 → 512，第二層 16 個像素 → 2048，第三層 64 個像素 → 8192
+HIERARCHICAL_THRESHOLDS = np.array([128 * 4] * 16 + [128 * 16] * 4 + [128 * 64], dtype=np.uint16)
+
+def calculate_image_sums(image, num_blocks=None):
+    """
+    功能:
+        直接從灰階圖像計算前 num_blocks 個 8×8 區塊的多層次像素總和（不先切成區塊）
+    
+    參數:
+        image: 灰階圖像 (H×W) 的 uint8 numpy array，H 和 W 必須是 8 的倍數
+        num_blocks: 只計算前幾個區塊（預設全部，區塊順序與 split_into_blocks 相同）
+    
+    返回:
+        sums: 形狀 (num_blocks, 21) 的 uint16 numpy array，順序與 calculate_hierarchical_averages 的 21 個平均值相同
+    
+    原理:
+        split_into_blocks 交換軸後再 reshape 會把整張圖的像素複製成 (N, 8, 8)，
+        這裡改在 (區塊列數, 4, 2, 區塊行數, 4, 2) 的視圖上直接加總第一層（不複製像素），
+        只有 1/4 大小的第一層總和需要交換軸排成區塊順序，第二、三層再由第一層相加
+    """
+    image = np.asarray(image, dtype=np.uint8)   # 已是 uint8 時不複製
+    height, width = image.shape
+    num_rows = height // 8
+    num_cols = width // 8
+    
+    if num_blocks is None:
+        num_blocks = num_rows * num_cols
+    
+    # 只取涵蓋前 num_blocks 個區塊所需的區塊列
+    rows_needed = min(num_rows, -(-num_blocks // num_cols))
+    total_blocks = rows_needed * num_cols
+    pixels = image[:rows_needed * 8].reshape(rows_needed, 4, 2, num_cols, 4, 2)
+    
+    # ========== 第一層: 在圖像視圖上直接計算 2×2 總和 ==========
+    top = pixels[:, :, 0].astype(np.uint16)   # 每個 2×2 的上排像素，形狀 (列, 4, 行, 4, 2)
+    bottom = pixels[:, :, 1]                  # 每個 2×2 的下排像素
+    layer1 = top[..., 0] + top[..., 1]
+    layer1 += bottom[..., 0]
+    layer1 += bottom[..., 1]
+    
+    # 只在第一層總和上交換軸：(列, 4, 行, 4) → (區塊數, 4, 4)
+    layer1 = layer1.transpose(0, 2, 1, 3).reshape(total_blocks, 4, 4)
+    
+    # ========== 第二層: 每個區塊 4 個分組總和 ==========
+    groups = layer1.reshape(total_blocks, 2, 2, 2, 2)
+    layer2 = groups[:, :, 0, :, 0] + groups[:, :, 0, :, 1] + groups[:, :, 1, :, 0] + groups[:, :, 1, :, 1]
+    
+    # ========== 第三層: 每個區塊 1 個總和 ==========
+    layer3 = layer2[:, 0, 0] + layer2[:, 0, 1] + layer2[:, 1, 0] + layer2[:, 1, 1]
+    
+    # ========== 合併三層結果 ==========
+    sums = np.empty((total_blocks, 21), dtype=np.uint16)
+    sums[:, :16] = layer1.reshape(total_blocks, 16)
+    sums[:, 16:20] = layer2.reshape(total_blocks, 4)
+    sums[:, 20] = layer3
+    
+    return sums[:num_blocks]
@@ -4,16 +4,19 @@
 import streamlit as st
 import streamlit.components.v1 as components
 import numpy as np
-from PIL import Image
-import requests
+from PIL import Image, ImageOps, ImageFilter
 from io import BytesIO
 import os
 import math
 import time
+import threading
 import base64
 import json
-import qrcode
+import logging
+import gzip
 import html
+import re
+from bisect import bisect_left
 
 # 延遲載入 pyzbar（較慢的套件）
 @st.cache_resource
@@ -21,6 +24,134 @@ def load_pyzbar():
     from pyzbar.pyzbar import decode as decode_qr
     return decode_qr
 
+# 大圖先縮小到這些寬度掃描 QR Code（由小到大）
+QR_SCAN_WIDTHS = (1500, 2000)
+
+# 原圖解碼失敗時依序嘗試的前處理（輸入和輸出都是灰階 PIL Image）
+QR_PREPROCESS_STEPS = (
+    ImageOps.invert,                                     # 反白（白底黑碼 ↔ 黑底白碼）
+    ImageOps.autocontrast,                               # 拉開對比
+    ImageOps.equalize,                                   # 直方圖等化
+    lambda gray: otsu_binarize(gray),                    # Otsu 二值化
+    lambda gray: gray.filter(ImageFilter.MaxFilter(3)),  # 膨脹（補斷裂的白色區域）
+    lambda gray: gray.filter(ImageFilter.MinFilter(3)),  # 侵蝕（補斷裂的黑色模組）
+)
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def decode_qr_cached(image_bytes):
+    """
+    功能:
+        解碼上傳圖片中的 QR Code（以圖片內容快取結果）
+    
+    參數:
+        image_bytes: 上傳圖片的 bytes 資料
+    
+    返回:
+        list: 每個 QR Code 的內容（bytes），沒有偵測到則為空列表
+    
+    原理:
+        上傳後每次重新執行頁面都會再跑一次解碼，pyzbar 在大圖上很慢；
+        同一張圖片（相同 bytes）直接使用快取的結果
+        pyzbar 的時間隨像素數快速增加，寬度超過 QR_SCAN_WIDTHS 的大圖先用縮小版掃描，
+        都失敗才掃描原圖（結果不會比只掃原圖差）
+        這裡不做前處理：一般上傳的是 Z碼圖，沒有 QR Code，前處理重試交給 decode_qr_preprocessed，
+        等圖像 Z碼也解碼失敗後才呼叫
+    """
+    decode_qr = load_pyzbar()
+    img = Image.open(BytesIO(image_bytes))
+    
+    for width in QR_SCAN_WIDTHS:
+        if img.width > width:
+            small = img.resize((width, max(1, round(img.height * width / img.width))), Image.BILINEAR)
+            decoded = decode_qr(small)
+            if decoded:
+                return [symbol.data for symbol in decoded]
+    
+    decoded = decode_qr(img)
+    return [symbol.data for symbol in decoded]
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def decode_qr_preprocessed(image_bytes):
+    """
+    功能:
+        對上傳圖片依序套用前處理後再解碼 QR Code（以圖片內容快取結果）
+    
+    參數:
+        image_bytes: 上傳圖片的 bytes 資料
+    
+    返回:
+        list: 每個 QR Code 的內容（bytes），所有前處理都失敗則為空列表
+    
+    原理:
+        用於拍照、反白或對比不足的 QR Code，依 QR_PREPROCESS_STEPS 由便宜到昂貴嘗試
+        每一步都要整張圖處理並重新掃描，只在 decode_qr_cached 和圖像 Z碼都解碼失敗時才呼叫
+    """
+    decode_qr = load_pyzbar()
+    gray = Image.open(BytesIO(image_bytes)).convert('L')
+    
+    for transform in QR_PREPROCESS_STEPS:
+        decoded = decode_qr(transform(gray))
+        if decoded:
+            return [symbol.data for symbol in decoded]
+    
+    return []
+
+def parse_qr_z_code(decoded):
+    """
+    功能:
+        解析 QR Code 內容中的 Z碼和額外資訊
+    
+    參數:
+        decoded: decode_qr_cached / decode_qr_preprocessed 的結果
+    
+    返回:
+        tuple: (風格編號, 圖像編號, 尺寸, Z碼文字)，不是 Z碼 QR Code 則為 None
+    
+    格式:
+        新格式: 風格編號-圖像編號-尺寸|Z碼
+        舊格式: 圖像編號-尺寸|Z碼（預設風格=建築）
+    """
+    if not decoded:
+        return None
+    
+    qr_content = decoded[0].decode('utf-8')
+    if '|' not in qr_content:
+        return None
+    
+    header, z_text = qr_content.split('|', 1)
+    parts = header.split('-')
+    if len(parts) == 3:
+        return int(parts[0]), int(parts[1]), int(parts[2]), z_text
+    if len(parts) == 2:
+        return 1, int(parts[0]), int(parts[1]), z_text
+    
+    return None
+
+def otsu_binarize(gray):
+    """
+    功能:
+        用 Otsu 方法自動選擇門檻，把灰階圖二值化
+    
+    參數:
+        gray: PIL Image（灰階 'L'）
+    
+    返回:
+        PIL Image: 只有 0 和 255 的灰階圖
+    
+    原理:
+        對 256 個可能的門檻一次計算類間變異數（numpy 累積和），取最大者
+    """
+    pixels = np.asarray(gray)
+    hist = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    weight_low = np.cumsum(hist)                        # 門檻以下（含）的像素數
+    weight_high = weight_low[-1] - weight_low           # 門檻以上的像素數
+    sum_low = np.cumsum(hist * np.arange(256))
+    mean_low = sum_low / np.maximum(weight_low, 1)
+    mean_high = (sum_low[-1] - sum_low) / np.maximum(weight_high, 1)
+    between_variance = weight_low * weight_high * (mean_low - mean_high) ** 2
+    threshold = int(np.argmax(between_variance))
+    return Image.fromarray(np.where(pixels > threshold, 255, 0).astype(np.uint8), 'L')
+
 # 載入自訂模組
 from config import *
 from embed import embed_secret, calculate_capacity
@@ -29,7 +160,13 @@ from secret_encoding import text_to_binary
 from text_encoding import z_to_text, text_to_z
 from image_encoding import z_to_image_with_header, image_to_z_with_header
 
+# 背景工作（例如預先下載圖片）的錯誤記錄
+logger = logging.getLogger(__name__)
+
 # ==================== 輔助函數 ====================
+# 「正常」字符（字母、數字、空格、常見標點）的刪除表：text.translate 刪掉這些字符後，長度差就是正常字符數
+NORMAL_CHARS_DELETE_TABLE = dict.fromkeys(map(ord, 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 \n\r\t，。！？、；：""''（）'))
+
 def is_likely_garbled_text(text):
     """
     功能:
@@ -44,19 +181,16 @@ def is_likely_garbled_text(text):
     if not text or len(text) == 0:
         return True
     
-    # 計算中文字符數量
-    chinese_count = 0
-    for char in text:
-        if '\u4e00' <= char <= '\u9fff':
-            chinese_count += 1
+    # 計算中文字符數量（轉成 Unicode 碼位陣列，一次比較全部字符）
+    codepoints = np.frombuffer(text.encode('utf-32-le', errors='surrogatepass'), dtype=np.uint32)
+    chinese_count = int(np.count_nonzero((codepoints >= 0x4e00) & (codepoints <= 0x9fff)))
     
     # 如果超過 30% 是中文，認為是正常文字
     if (chinese_count / len(text)) > 0.3:
         return False
     
     # 計算「正常」字符的比例（字母、數字、空格、常見標點）
-    normal_chars = set('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 \n\r\t，。！？、；：""''（）')
-    normal_count = sum(1 for c in text if c in normal_chars)
+    normal_count = len(text) - len(text.translate(NORMAL_CHARS_DELETE_TABLE))
     
     # 如果正常字符比例低於 70%，認為是亂碼
     if (normal_count / len(text)) < 0.7:
@@ -70,18 +204,18 @@ def is_likely_garbled_image(image_data):
         檢測圖像是否可能是亂碼（雜訊圖）
     
     參數:
-        image_data: 圖像的 bytes 資料
+        image_data: PIL Image，或圖像的 bytes 資料（已解碼的圖像直接傳入，不必再解碼一次）
     
     返回:
         bool: True 表示可能是亂碼
     """
     try:
-        img = Image.open(BytesIO(image_data))
-        img_array = np.array(img.convert('RGB'))
+        img = image_data if isinstance(image_data, Image.Image) else Image.open(BytesIO(image_data))
+        img_array = np.asarray(img.convert('RGB'), dtype=np.int16)  # int16 足以表示 -255~255 的差值
         
-        # 計算相鄰像素的差異
-        h_diff = np.abs(img_array[:, 1:, :].astype(int) - img_array[:, :-1, :].astype(int))
-        v_diff = np.abs(img_array[1:, :, :].astype(int) - img_array[:-1, :, :].astype(int))
+        # 計算相鄰像素的差異（平均差異只是統計量，每 4 列／4 行取樣一條即可）
+        h_diff = np.abs(np.diff(img_array[::4], axis=1))     # 每 4 列，左右相鄰像素
+        v_diff = np.abs(np.diff(img_array[:, ::4], axis=0))  # 每 4 行，上下相鄰像素
         
         avg_diff = (np.mean(h_diff) + np.mean(v_diff)) / 2
         
@@ -104,37 +238,70 @@ def generate_gradient_image(size, color1, color2, direction='horizontal'):
     返回:
         img: PIL Image 物件
     """
-    img = Image.new('RGB', (size, size))
-    for i in range(size):
-        ratio = i / size
-        r = int(color1[0] + (color2[0] - color1[0]) * ratio)
-        g = int(color1[1] + (color2[1] - color1[1]) * ratio)
-        b = int(color1[2] + (color2[2] - color1[2]) * ratio)
-        for j in range(size):
-            if direction == 'horizontal':
-                img.putpixel((i, j), (r, g, b))
-            else:
-                img.putpixel((j, i), (r, g, b))
+    # 每個位置的顏色（size × 3），小數部分捨去，同 int()
+    ratio = np.arange(size) / size
+    start = np.array(color1, dtype=np.float64)
+    end = np.array(color2, dtype=np.float64)
+    colors = (start + (end - start) * ratio[:, None]).astype(np.uint8)
+    
+    # 水平漸層：每一列都相同；垂直漸層：每一行都相同
+    if direction == 'horizontal':
+        pixels = np.broadcast_to(colors[None, :, :], (size, size, 3))
+    else:
+        pixels = np.broadcast_to(colors[:, None, :], (size, size, 3))
+    
+    img = Image.fromarray(np.ascontiguousarray(pixels), 'RGB')
     return img
 
+@st.cache_data(show_spinner=False)
 def get_icon_base64(icon_name):
     """
     功能:
-        讀取 icons 資料夾的圖片並轉成 base64
+        讀取 icons 資料夾的圖片並轉成 base64（快取結果，重新執行頁面時不必再讀檔編碼）
     
     參數:
         icon_name: 圖示名稱（不含副檔名）
     
     返回:
         str: base64 編碼的圖片資料 URI，若檔案不存在則返回空字串
+    
+    原理:
+        優先使用 WebP（無損壓縮，比 PNG 小約 4 成，內嵌在首頁 HTML 的資料量較少），沒有才用 PNG
     """
-    icon_path = os.path.join("icons", f"{icon_name}.png")
-    if os.path.exists(icon_path):
-        with open(icon_path, "rb") as f:
-            data = base64.b64encode(f.read()).decode()
-        return f"data:image/png;base64,{data}"
+    for ext, mime in (("webp", "image/webp"), ("png", "image/png")):
+        icon_path = os.path.join("icons", f"{icon_name}.{ext}")
+        if os.path.exists(icon_path):
+            with open(icon_path, "rb") as f:
+                data = base64.b64encode(f.read()).decode()
+            return f"data:{mime};base64,{data}"
     return ""
 
+@st.cache_data(show_spinner=False)
+def generate_qr_png(content):
+    """
+    功能:
+        把文字內容產生成 QR Code 的 PNG 圖片（快取結果，重新執行頁面時不必重新產生）
+    
+    參數:
+        content: QR Code 內容字串
+    
+    返回:
+        bytes: PNG 圖片資料
+    
+    原理:
+        QR Code 只有黑白兩色，PNG 壓縮等級 1 檔案大小幾乎不變，但存檔快很多
+        qrcode 只有產生 QR Code 時才載入
+    """
+    import qrcode
+    qr = qrcode.QRCode(version=None, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=2)
+    qr.add_data(content)
+    qr.make(fit=True)
+    qr_pil = qr.make_image(fill_color="black", back_color="white").convert('RGB')
+    
+    buf = BytesIO()
+    qr_pil.save(buf, format='PNG', compress_level=1)
+    return buf.getvalue()
+
 # ==================== 全局緩存 ====================
 if 'embed_result' not in st.session_state:
     st.session_state.embed_result = None
@@ -153,10 +320,11 @@ def generate_contact_key():
     import secrets
     return secrets.token_hex(16) 
 
+@st.cache_resource(show_spinner=False)
 def get_supabase_client():
     """
     功能:
-        取得 Supabase 客戶端連線
+        取得 Supabase 客戶端連線（整個應用程式共用同一個客戶端，不必每次重新建立）
     
     返回:
         Client: Supabase 客戶端物件，若連線失敗則返回 None
@@ -169,10 +337,12 @@ def get_supabase_client():
     except Exception as e:
         return None
 
+@st.cache_data(ttl=60, show_spinner=False)
 def load_contacts():
     """
     功能:
         從 Supabase 讀取對象資料，若失敗則嘗試讀取本地 JSON
+        結果快取 60 秒，多個使用者／重新整理頁面時共用同一份資料；save_contacts 會清除快取
     
     返回:
         dict: 對象資料字典，格式為 {名稱: {"style": 風格, "key": 密鑰}}
@@ -223,13 +393,14 @@ def save_contacts(contacts):
         if supabase:
             # 先刪除所有現有資料
             supabase.table("contacts").delete().neq("name", "").execute()
-            # 插入新資料
-            for name, data in contacts.items():
-                supabase.table("contacts").insert({
-                    "name": name,
-                    "style": data.get("style"),
-                    "key": data.get("key")
-                }).execute()
+            # 插入新資料（所有對象一次批次插入，只需一次網路往返）
+            rows = [
+                {"name": name, "style": data.get("style"), "key": data.get("key")}
+                for name, data in contacts.items()
+            ]
+            if rows:
+                supabase.table("contacts").insert(rows).execute()
+            load_contacts.clear()  # 資料已變更，下次讀取時重新查詢
             return True
     except Exception as e:
         pass
@@ -238,6 +409,7 @@ def save_contacts(contacts):
     try:
         with open("contacts.json", 'w', encoding='utf-8') as f:
             json.dump(contacts, f, ensure_ascii=False, indent=2)
+        load_contacts.clear()
     except:
         pass
     return False
@@ -291,14 +463,14 @@ STYLE_CATEGORIES = {
     "5. 交通": "交通",
 }
 
-STYLE_TO_NUM = {
-    "1. 建築": 1, "2. 動物": 2, "3. 植物": 3, "4. 食物": 4, "5. 交通": 5,
-    "建築": 1, "動物": 2, "植物": 3, "食物": 4, "交通": 5,
-}
-
 NUM_TO_STYLE = {1: "建築", 2: "動物", 3: "植物", 4: "食物", 5: "交通"}
 
+# 由 NUM_TO_STYLE 和 STYLE_CATEGORIES 推導，顯示名稱（"1. 建築"）和風格名稱（"建築"）都能一次查到編號
+STYLE_TO_NUM = {name: num for num, name in NUM_TO_STYLE.items()}
+STYLE_TO_NUM.update({label: STYLE_TO_NUM[name] for label, name in STYLE_CATEGORIES.items()})
+
 AVAILABLE_SIZES = [64, 128, 256, 512, 1024, 2048, 4096]
+AVAILABLE_CAPACITIES = [calculate_capacity(size, size) for size in AVAILABLE_SIZES]  # 各尺寸的容量（由小到大）
 
 IMAGE_LIBRARY = {
     "建築": [
@@ -360,829 +532,347 @@ def get_recommended_size(secret_bits):
     返回:
         int: 推薦的圖像尺寸（邊長）
     """
-    for size in AVAILABLE_SIZES:
-        capacity = calculate_capacity(size, size)
-        if capacity >= secret_bits:
-            return size
-    return AVAILABLE_SIZES[-1]
+    # 容量隨尺寸遞增，二分搜尋第一個容量 ≥ secret_bits 的尺寸
+    index = bisect_left(AVAILABLE_CAPACITIES, secret_bits)
+    return AVAILABLE_SIZES[min(index, len(AVAILABLE_SIZES) - 1)]
 
-@st.cache_data(ttl=86400, show_spinner=False)
-def download_image_cached(pexels_id, size):
+# 單張圖片下載上限（超過就放棄，避免異常的回應佔用大量記憶體）
+MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+
+# 下載過的圖片存放位置（跨程序、重新啟動後仍有效）
+IMAGE_CACHE_DIR = ".image_cache"
+
+@st.cache_resource(show_spinner=False)
+def get_http_session():
+    """
+    功能:
+        取得共用的 HTTP 連線（requests.Session），下載多張圖片時重複使用同一條連線
+    
+    返回:
+        Session: requests.Session 物件
+    """
+    import requests  # 只有真的要下載時才載入
+    return requests.Session()
+
+def fetch_image(pexels_id, size, session=None):
     """
     功能:
-        從 Pexels 下載圖片並快取（快取有效期 24 小時）
+        從 Pexels 下載圖片（不快取）
     
     參數:
         pexels_id: Pexels 圖片 ID
         size: 請求的圖片尺寸
+        session: 使用的 requests.Session（預設為 get_http_session()；背景執行緒必須由呼叫端傳入）
     
     返回:
-        bytes: 圖片的二進位資料，若下載失敗則返回 None
+        bytes: 圖片的二進位資料，若下載失敗或超過 MAX_DOWNLOAD_BYTES 則返回 None
     """
+    if session is None:
+        session = get_http_session()
+    
     url = f"https://images.pexels.com/photos/{pexels_id}/pexels-photo-{pexels_id}.jpeg?auto=compress&cs=tinysrgb&w={size}&h={size}&fit=crop"
     try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            return response.content
+        # 分段讀取回應，超過上限就提前中止
+        with session.get(url, timeout=10, stream=True) as response:
+            if response.status_code != 200:
+                return None
+            buffer = BytesIO()
+            for chunk in response.iter_content(chunk_size=65536):
+                buffer.write(chunk)
+                if buffer.tell() > MAX_DOWNLOAD_BYTES:
+                    return None
+            return buffer.getvalue()
     except:
         pass
     return None
 
-def download_image_by_id(pexels_id, size):
+def get_image_cache_path(pexels_id, size):
     """
     功能:
-        下載指定 ID 和尺寸的圖片，並轉換為 RGB 和灰階版本
+        取得圖片在 IMAGE_CACHE_DIR 中的檔案路徑
+    """
+    return os.path.join(IMAGE_CACHE_DIR, f"{pexels_id}_{size}.jpg")
+
+def fetch_image_to_disk(pexels_id, size, session=None):
+    """
+    功能:
+        下載圖片並存到 IMAGE_CACHE_DIR（不使用任何 Streamlit 快取，可在背景執行緒呼叫）
     
     參數:
         pexels_id: Pexels 圖片 ID
-        size: 目標圖片尺寸
+        size: 請求的圖片尺寸
+        session: 使用的 requests.Session（同 fetch_image）
     
     返回:
-        tuple: (RGB 圖片, 灰階圖片)，若下載失敗則返回漸層備用圖
+        bytes: 圖片的二進位資料，若下載失敗則返回 None
+    
+    原理:
+        寫入時先寫暫存檔再改名，多個執行緒同時下載同一張圖也不會讀到寫到一半的檔案
     """
-    image_data = download_image_cached(pexels_id, size)
+    data = fetch_image(pexels_id, size, session)
     
-    if image_data:
-        img = Image.open(BytesIO(image_data)).convert('RGB')
-        if img.size[0] != size or img.size[1] != size:
-            img = img.resize((size, size), Image.LANCZOS)
-        img_gray = img.convert('L')
-        return img, img_gray
+    if data:
+        cache_path = get_image_cache_path(pexels_id, size)
+        try:
+            os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+            temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, cache_path)
+        except OSError:
+            pass  # 無法寫入硬碟（例如唯讀環境）時只使用記憶體快取
     
-    img = generate_gradient_image(size, (100, 150, 200), (150, 200, 250))
-    return img, img.convert('L')
+    return data
 
-# ==================== 圖像容量計算 ====================
-def calculate_required_bits_for_image(image):
+@st.cache_data(ttl=86400, show_spinner=False)
+def download_image_cached(pexels_id, size):
     """
     功能:
-        計算圖像作為機密時所需的位元數
+        取得 Pexels 圖片並快取（記憶體快取有效期 24 小時，另存一份在 IMAGE_CACHE_DIR）
     
     參數:
-        image: PIL Image 物件
+        pexels_id: Pexels 圖片 ID
+        size: 請求的圖片尺寸
     
     返回:
-        tuple: (所需位元數, 圖像尺寸)
-    """
-    size, mode = image.size, image.mode
-    is_color = mode not in ['L', '1', 'LA']
-    
-    # 判斷是否有透明通道
-    if not is_color:
-        has_alpha = False
-    elif mode == 'P':
-        temp_img = image.convert('RGBA')
-        alpha_channel = temp_img.split()[-1]
-        has_alpha = alpha_channel.getextrema()[0] < 255
-    elif mode in ['RGBA', 'PA']:
-        has_alpha = True
-    else:
-        has_alpha = False
-    
-    # 計算所需位元數
-    header_bits = 34
-    if is_color:
-        bits_per_pixel = 32 if has_alpha else 24
-    else:
-        bits_per_pixel = 8
+        bytes: 圖片的二進位資料，若下載失敗則返回 None
     
-    required_bits = header_bits + size[0] * size[1] * bits_per_pixel
+    原理:
+        記憶體快取只在目前的程序內有效，重新啟動或部署後會清空；
+        下載過的圖片存到硬碟（包括背景預先下載的圖片），之後優先讀取硬碟，不必再向 Pexels 下載
+    """
+    try:
+        with open(get_image_cache_path(pexels_id, size), "rb") as f:
+            return f.read()
+    except OSError:
+        pass
     
-    return required_bits, size
-
-# ==================== Streamlit 頁面配置 ====================
-# 設定頁面標題、圖示、寬螢幕模式、隱藏側邊欄
-st.set_page_config(page_title="🔐 高效能無載體之機密編碼技術", page_icon="🔐", layout="wide", initial_sidebar_state="collapsed")
-
-# ==================== CSS 樣式 ====================
-# 包含：背景圖片、隱藏 Streamlit 預設元素、側邊欄樣式、按鈕樣式、表單樣式等
-st.markdown("""
-<style>
-/* ----- 背景圖片 ----- */
-.stApp {
-    background-image: url('https://i.pinimg.com/736x/53/1a/01/531a01457eca178f01c83ac2ede3f102.jpg');
-    background-size: 100% 100%;
-    background-position: center;
-    background-repeat: no-repeat;
-    background-attachment: fixed;
-}
-
-/* ----- 隱藏 Streamlit 預設元素（header、footer、deploy按鈕等）----- */
-header[data-testid="stHeader"],
-#MainMenu, footer, .stDeployButton, div[data-testid="stToolbar"],
-.viewerBadge_container__r5tak, .viewerBadge_link__qRIco,
-div[class*="viewerBadge"], div[class*="StatusWidget"],
-[data-testid="manage-app-button"], .stApp > footer,
-iframe[title="Streamlit"], div[class*="styles_viewerBadge"],
-.stAppDeployButton, section[data-testid="stStatusWidget"] {
-    display: none !important;
-    visibility: hidden !important;
-}
-
-/* ----- 隱藏側邊欄控制按鈕（Streamlit 預設的展開/收合按鈕）----- */
-button[data-testid="collapsedControl"],
-[data-testid="collapsedControl"],
-[data-testid="stSidebarCollapsedControl"],
-button[data-testid="baseButton-header"],
-[data-testid="stSidebarNavCollapseIcon"],
-[data-testid="stSidebar"] > button,
-[data-testid="stSidebarNav"] button,
-[data-testid="stSidebarNavSeparator"],
-[data-testid="stSidebarCollapseButton"],
-section[data-testid="stSidebar"] > div > button,
-section[data-testid="stSidebar"] button[kind="header"],
-.st-emotion-cache-1rtdyuf,
-.st-emotion-cache-eczf16 {
-    display: none !important;
-    visibility: hidden !important;
-    width: 0 !important;
-    height: 0 !important;
-    opacity: 0 !important;
-    pointer-events: none !important;
-}
-
-/* ----- 自訂「對象管理」標籤（左側垂直標籤）----- */
-#sidebar-toggle-label {
-    position: fixed;
-    top: 77px;
-    left: 0;
-    color: white;
-    writing-mode: vertical-rl;
-    padding: 15px 8px;
-    border-radius: 0 6px 6px 0;
-    font-size: 24px;
-    font-weight: bold;
-    z-index: 999999;
-    cursor: pointer;
-    box-shadow: 2px 0 8px rgba(0,0,0,0.15);
-    transition: all 0.3s ease;
-}
-#sidebar-toggle-label:hover {
-    padding-left: 12px;
-}
-
-/* ----- 主內容區 ----- */
-[data-testid="stMain"] {
-    margin-left: 0 !important;
-    width: 100% !important;
-}
-
-/* ----- 側邊欄樣式（對象管理面板）----- */
-[data-testid="stSidebar"] {
-    position: fixed !important;
-    left: 0 !important;
-    top: 0 !important;
-    height: 100vh !important;
-    width: 18rem !important;
-    min-width: 18rem !important;
-    z-index: 999 !important;
-    transition: transform 0.3s ease !important;
-    transform: translateX(-100%);
-    background-image: url('https://i.pinimg.com/736x/53/1a/01/531a01457eca178f01c83ac2ede3f102.jpg') !important;
-    background-size: cover !important;
-    background-position: center !important;
-    box-shadow: 4px 0 15px rgba(0,0,0,0.2) !important;
-}
-
-/* 側邊欄展開狀態 */
-[data-testid="stSidebar"].sidebar-open {
-    transform: translateX(0) !important;
-}
-
-/* 側邊欄文字顏色 */
-[data-testid="stSidebar"] * { color: #443C3C !important; }
-
-/* 側邊欄輸入框樣式 */
-[data-testid="stSidebar"] input,
-[data-testid="stSidebar"] textarea {
-    background-color: #ecefef !important;
-    color: #333 !important;
-    border: 1px solid #ccc !important;
-}
-
-/* 側邊欄標題 */
-[data-testid="stSidebar"] h3 {
-    font-size: 38px !important;
-    font-weight: bold !important;
-    color: #4A6B8A !important;
-    text-align: center !important;
-}
-
-[data-testid="stSidebar"] strong { font-size: 18px !important; }
-
-/* 側邊欄 Expander（新增對象、對象列表的展開區塊）*/
-[data-testid="stSidebar"] [data-testid="stExpander"] summary,
-[data-testid="stSidebar"] details summary span {
-    font-size: 24px !important;
-}
-
-[data-testid="stSidebar"] [data-testid="stExpander"] {
-    width: 100% !important;
-    background-color: #f7f3ec !important;
-    border: 2px solid rgba(200, 200, 200, 0.6) !important;
-    border-radius: 10px !important;
-    box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1) !important;
-    margin-bottom: 8px !important;
-}
-
-/* Expander 標題列背景 */
-[data-testid="stSidebar"] [data-testid="stExpander"] > details > summary {
-    background-color: #f7f3ec !important;
-    border-radius: 8px !important;
-}
-
-/* Expander 展開後內容背景 */
-[data-testid="stSidebar"] [data-testid="stExpander"] > div {
-    background-color: transparent !important;
-}
-
-[data-testid="stSidebar"] [data-testid="stExpander"] [data-testid="stExpanderDetails"] {
-    background-color: #e9ded0 !important;
-}
-
-/* ----- 側邊欄下拉選單樣式 ----- */
-[data-testid="stSidebar"] .stSelectbox > div > div {
-    background-color: #ecefef !important;
-    color: #333 !important;
-    border: 1px solid #ccc !important;
-    min-height: 45px !important;
-    display: flex !important;
-    align-items: center !important;
-}
-
-[data-testid="stSidebar"] .stSelectbox [data-baseweb="select"] span,
-[data-testid="stSidebar"] .stSelectbox [data-baseweb="select"] div {
-    color: #333 !important;
-    font-size: 22px !important;
-    overflow: visible !important;
-}
-
-[data-testid="stSidebar"] .stSelectbox [data-baseweb="select"] > div {
-    padding-top: 3px !important;
-    padding-bottom: 6px !important;
-}
-
-/* 禁用 selectbox 的搜索輸入（避免輸入文字搜尋）*/
-[data-testid="stSidebar"] .stSelectbox [data-baseweb="select"] input {
-    pointer-events: none !important;
-    caret-color: transparent !important;
-    opacity: 0 !important;
-    width: 1px !important;
-}
-
-/* 側邊欄輸入框 - 確保可以輸入 */
-[data-testid="stSidebar"] .stTextInput input {
-    pointer-events: auto !important;
-    opacity: 1 !important;
-    caret-color: #333 !important;
-    font-size: 22px !important;
-}
-
-[data-testid="stSidebar"] input,
-[data-testid="stSidebar"] select,
-[data-testid="stSidebar"] button {
-    font-size: 22px !important;
-}
-
-/* ----- 側邊欄按鈕樣式 ----- */
-[data-testid="stSidebar"] .stButton button {
-    background-color: #ecefef !important;
-    color: #333 !important;
-    border: 1px solid #ccc !important;
-}
-
-[data-testid="stSidebar"] .stButton button:hover {
-    background-color: #e8e8e8 !important;
-    border-color: #4f7343 !important;
-}
-
-[data-testid="stSidebar"] .stButton button span,
-[data-testid="stSidebar"] .stButton button p {
-    font-size: 22px !important;
-}
-
-[data-testid="stSidebar"] [data-testid="stBaseButton-header"],
-[data-testid="stSidebar"] button[kind="header"] {
-    display: none !important;
-}
-
-/* ----- 頁面標題樣式（嵌入/提取）----- */
-.page-title-embed {
-    font-size: clamp(36px, 4vw, 56px);
-    font-weight: bold;
-    background: linear-gradient(135deg, #4A6B8A 0%, #5C8AAD 100%);
-    -webkit-background-clip: text;
-    -webkit-text-fill-color: transparent;
-    background-clip: text;
-}
-
-.page-title-extract {
-    font-size: clamp(36px, 4vw, 56px);
-    font-weight: bold;
-    background: linear-gradient(135deg, #7D5A6B 0%, #A67B85 100%);
-    -webkit-background-clip: text;
-    -webkit-text-fill-color: transparent;
-    background-clip: text;
-}
-
-/* ----- 錯誤訊息框（嵌入失敗、提取失敗時顯示）----- */
-.error-box {
-    background: linear-gradient(135deg, #8B5A5A 0%, #A67B7B 100%);
-    color: white; padding: 20px 30px; border-radius: 10px;
-    margin: 10px 0; display: inline-block; font-size: clamp(18px, 2vw, 26px); min-width: 300px;
-}
-
-/* ----- 主內容區文字放大 ----- */
-[data-testid="stMain"] .stMarkdown p,
-[data-testid="stMain"] .stText p {
-    font-size: clamp(22px, 2.5vw, 30px) !important;
-    font-weight: bold !important;
-}
-
-/* ----- 小提示文字樣式（💡 點擊「對象管理」可修改資料）----- */
-[data-testid="stMain"] .stMarkdown p.hint-text,
-[data-testid="stMain"] .stMarkdown div.hint-text,
-p.hint-text,
-div.hint-text {
-    font-size: 22px !important;
-    font-weight: bold !important;
-    color: #4f7343 !important;
-}
-
-/* ----- 資訊文字樣式（容量、已選擇對象）----- */
-.bits-info,
-.selected-info {
-    font-size: 24px !important;
-    color: #4f7343 !important;
-    font-weight: bold !important;
-}
-
-/* ----- h3 標題樣式 ----- */
-h3 { font-size: clamp(28px, 3vw, 36px) !important; font-weight: bold !important; }
-
-/* ----- 主內容區按鈕樣式 ----- */
-/* Primary 按鈕（開始嵌入、開始提取等）*/
-[data-testid="stMain"] .stButton button[kind="primary"] {
-    background: #4A6B8A !important;
-    color: white !important;
-    border: none !important;
-    border-radius: 8px !important;
-    font-size: 24px !important;
-    padding: 8px 20px !important;
-    min-width: 80px !important;
-}
-
-/* Secondary 按鈕（返回、文字/圖像切換等）*/
-[data-testid="stMain"] .stButton button[kind="secondary"] {
-    background: #ecefef !important;
-    color: #666 !important;
-    border: 2px solid #ccc !important;
-    border-radius: 8px !important;
-    font-size: 24px !important;
-    padding: 8px 20px !important;
-    min-width: 80px !important;
-}
-
-[data-testid="stMain"] .stButton button[kind="secondary"]:hover {
-    background: #e0e0e0 !important;
-    border-color: #4f7343 !important;
-}
-
-[data-testid="stMain"] .stButton button[kind="primary"] span,
-[data-testid="stMain"] .stButton button[kind="primary"] p {
-    font-size: 24px !important;
-}
-
-[data-testid="stMain"] .stButton button[kind="secondary"] span,
-[data-testid="stMain"] .stButton button[kind="secondary"] p {
-    font-size: 24px !important;
-}
-
-/* 側邊欄 primary 按鈕（新增按鈕）*/
-[data-testid="stSidebar"] .stButton button[kind="primary"] {
-    background: #8ba7c8 !important;
-    color: white !important;
-    border: none !important;
-    border-radius: 8px !important;
-}
-
-/* ----- 表單元素標籤樣式（主內容區）----- */
-[data-testid="stMain"] .stSelectbox label, 
-[data-testid="stMain"] .stSelectbox label p,
-[data-testid="stMain"] .stTextArea label, 
-[data-testid="stMain"] .stFileUploader label,
-[data-testid="stMain"] [data-testid="stWidgetLabel"] p {
-    font-size: 24px !important;
-    font-weight: bold !important;
-    color: #443C3C !important;
-}
-
-/* ----- 側邊欄表單標籤樣式 ----- */
-[data-testid="stSidebar"] .stSelectbox label,
-[data-testid="stSidebar"] .stTextInput label,
-[data-testid="stSidebar"] [data-testid="stWidgetLabel"] p {
-    font-size: 22px !important;
-    font-weight: bold !important;
-    color: #443C3C !important;
-}
-
-/* ----- TextArea 樣式（機密文字輸入框）----- */
-.stTextArea textarea {
-    font-size: 24px !important;
-    background-color: #ecefef !important;
-    border: 1px solid #ccc !important;
-    border-radius: 8px !important;
-    color: #333 !important;
-    padding: 12px !important;
-    caret-color: #333 !important;
-}
-
-.stTextArea textarea:focus {
-    outline: none !important;
-    border-color: #ccc !important;
-}
+    return fetch_image_to_disk(pexels_id, size)
 
-.stTextArea textarea::placeholder {
-    color: #888 !important;
-    opacity: 1 !important;
-}
-
-/* 移除 textarea 底部黑線 */
-.stTextArea [data-baseweb="textarea"] {
-    border: none !important;
-    background-color: transparent !important;
-}
-
-.stTextArea [data-baseweb="base-input"] {
-    border-bottom: none !important;
-    border: none !important;
-    background-color: transparent !important;
-}
-
-.stTextArea > div > div {
-    border-bottom: none !important;
-    background-color: transparent !important;
-}
-
-.stTextArea > div > div > div {
-    border-bottom: none !important;
-    background-color: #ecefef !important;
-}
-
-.stTextArea [data-baseweb="textarea"]::after,
-.stTextArea [data-baseweb="base-input"]::after {
-    display: none !important;
-}
-
-/* ----- Caption 樣式（檔案上傳提示文字）----- */
-.stCaption, [data-testid="stCaptionContainer"] {
-    color: #443C3C !important;
-    font-size: clamp(16px, 1.8vw, 22px) !important;
-}
-
-/* ----- FileUploader 樣式（上傳圖像、上傳 Z碼圖）----- */
-[data-testid="stFileUploader"] > div > div,
-[data-testid="stFileUploader"] [data-testid="stFileUploaderDropzone"] {
-    background-color: #ecefef !important;
-}
-
-/* Browse files 按鈕 */
-[data-testid="stFileUploader"] button {
-    background-color: #ecefef !important;
-    color: #443C3C !important;
-    border: 1px solid #ccc !important;
-}
-
-/* 已上傳檔案文字顏色 */
-[data-testid="stFileUploader"] section,
-[data-testid="stFileUploader"] section * {
-    color: #443C3C !important;
-}
-
-/* ----- Selectbox 樣式（下拉選單）----- */
-[data-testid="stMain"] .stSelectbox > div > div {
-    background-color: #ecefef !important;
-    border-radius: 8px !important;
-    min-height: 55px !important;
-    border: 1px solid #ccc !important;
-    padding-top: 4px !important;
-    padding-bottom: 4px !important;
-}
-
-[data-testid="stMain"] .stSelectbox [data-baseweb="select"] span,
-[data-testid="stMain"] .stSelectbox [data-baseweb="select"] div {
-    font-size: 24px !important;
-    font-weight: bold !important;
-    color: #333 !important;
-    overflow: visible !important;
-    line-height: 1.4 !important;
-}
-
-/* ----- 下拉選單列表樣式 ----- */
-[data-baseweb="popover"],
-[data-baseweb="popover"] > div,
-ul[role="listbox"] {
-    background-color: #ecefef !important;
-}
-
-[data-baseweb="popover"] li,
-[data-baseweb="menu"] li,
-ul[role="listbox"] li {
-    background-color: #ecefef !important;
-    font-size: 22px !important;
-    font-weight: normal !important;
-    color: #333 !important;
-    min-height: 50px !important;
-    padding: 12px 16px !important;
-}
-
-ul[role="listbox"] li:hover,
-[data-baseweb="menu"] li:hover {
-    background-color: #dce0e0 !important;
-}
-
-[data-baseweb="select"] [data-testid="stMarkdownContainer"],
-[data-baseweb="select"] div[class*="singleValue"] {
-    overflow: visible !important;
-    text-overflow: unset !important;
-    white-space: nowrap !important;
-}
-
-/* ----- 頁面間距調整 ----- */
-.block-container {
-    padding-top: 0.5rem !important;
-    padding-bottom: 3rem !important;
-    max-width: 1400px !important;
-    margin: 0 auto !important;
-    padding-left: 2rem !important;
-    padding-right: 2rem !important;
-}
-
-/* 內容區域居中對齊 */
-[data-testid="stMain"] .stSelectbox,
-[data-testid="stMain"] .stTextArea,
-[data-testid="stMain"] .stFileUploader,
-[data-testid="stMain"] .stMarkdown {
-    max-width: 1200px !important;
-    margin-left: auto !important;
-    margin-right: auto !important;
-}
-
-/* ----- 大螢幕優化 ----- */
-@media (min-width: 1600px) {
-    .block-container {
-        max-width: 1500px !important;
-        padding-left: 3rem !important;
-        padding-right: 3rem !important;
-    }
+@st.cache_resource(show_spinner=False)
+def get_prefetch_executor():
+    """
+    功能:
+        取得背景預先下載圖片用的執行緒池（整個應用程式共用）
     
-    .page-title-embed, .page-title-extract {
-        font-size: 56px !important;
-    }
-}
-
-/* 全螢幕模式優化 */
-@media (min-height: 900px) {
-    .block-container {
-        padding-top: 1rem !important;
-    }
-}
-
-/* ----- 下載按鈕樣式（Z碼圖、圖像）----- */
-[data-testid="stDownloadButton"] button {
-    background-color: #c9b89a !important;
-    color: #443C3C !important;
-    border: none !important;
-    font-weight: 700 !important;
-    font-size: 24px !important;
-    min-width: 120px !important;
-    padding: 8px 18px !important;
-}
-
-[data-testid="stDownloadButton"] button p,
-[data-testid="stDownloadButton"] button span {
-    font-weight: 700 !important;
-    font-size: 24px !important;
-}
-
-[data-testid="stDownloadButton"] button:hover {
-    background-color: #b8a788 !important;
-}
-
-[data-testid="stDownloadButton"] button:active,
-[data-testid="stDownloadButton"] button:focus {
-    background-color: #d9c8aa !important;
-}
-
-/* ----- 其他間距調整 ----- */
-.stMarkdown hr { margin: 0.5rem 0 !important; }
-.stSelectbox, .stTextArea, .stFileUploader { margin-bottom: 0.3rem !important; }
-
-[data-testid="stHorizontalBlock"] {
-    flex-wrap: nowrap !important;
-    gap: 0.3rem !important;
-    max-width: 1200px !important;
-    margin-left: auto !important;
-    margin-right: auto !important;
-}
-
-</style>
-""", unsafe_allow_html=True)
-
-# ==================== JavaScript：textarea 滾動條處理 ====================
-# 用 JavaScript 強制修改樣式，確保在 Streamlit 動態更新後仍然生效
-components.html("""
-<script>
-// 隱藏 textarea 滾動條（注入 CSS）
-function hideTextareaScrollbar() {
-    const css = `
-        .stTextArea::-webkit-scrollbar,
-        .stTextArea *::-webkit-scrollbar {
-            display: none !important;
-            width: 0 !important;
-            height: 0 !important;
-        }
-        .stTextArea,
-        .stTextArea * {
-            scrollbar-width: none !important;
-            -ms-overflow-style: none !important;
-        }
-    `;
-    
-    if (window.parent && window.parent.document && window.parent.document.head) {
-        const style = document.createElement('style');
-        style.textContent = css;
-        style.id = 'custom-scrollbar-style';
-        const oldStyle = window.parent.document.getElementById('custom-scrollbar-style');
-        if (oldStyle) oldStyle.remove();
-        window.parent.document.head.appendChild(style);
-    }
-}
-
-// 強制隱藏 textarea 所有滾動條（用 inline style 覆蓋)
-function fixTextareaScrollbar() {
-    if (window.parent && window.parent.document) {
-        const textareas = window.parent.document.querySelectorAll('.stTextArea');
-        textareas.forEach(ta => {
-            ta.style.cssText += 'overflow:hidden!important;scrollbar-width:none!important;';
-            
-            const allElements = ta.querySelectorAll('*');
-            allElements.forEach(el => {
-                if (el.tagName !== 'TEXTAREA') {
-                    el.style.cssText += 'overflow:hidden!important;scrollbar-width:none!important;-ms-overflow-style:none!important;';
-                }
-            });
-            
-            const textarea = ta.querySelector('textarea');
-            if (textarea) {
-                textarea.style.cssText += 'overflow-y:auto!important;scrollbar-width:none!important;-ms-overflow-style:none!important;';
-            }
-        });
-    }
-}
+    返回:
+        ThreadPoolExecutor: 最多 8 個執行緒
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=8)
 
-// 執行樣式注入
-hideTextareaScrollbar();
-fixTextareaScrollbar();
-setTimeout(hideTextareaScrollbar, 300);
-setTimeout(fixTextareaScrollbar, 300);
-setTimeout(hideTextareaScrollbar, 1000);
-setTimeout(fixTextareaScrollbar, 1000);
-setTimeout(fixTextareaScrollbar, 2000);
-
-// 監聽 DOM 變化，新元素出現時也套用樣式
-if (window.parent && window.parent.document) {
-    const observer = new MutationObserver(() => {
-        hideTextareaScrollbar();
-        fixTextareaScrollbar();
-    });
-    observer.observe(window.parent.document.body, { childList: true, subtree: true });
-}
-</script>
-""", height=0)
+def prefetch_image_file(pexels_id, size, session):
+    """
+    功能:
+        背景執行緒的工作：硬碟上還沒有這張圖片才下載（不碰任何 Streamlit 快取）
+    """
+    if not os.path.exists(get_image_cache_path(pexels_id, size)):
+        fetch_image_to_disk(pexels_id, size, session)
 
-# ==================== 初始化狀態 ====================
-# current_mode: None=首頁, 'embed'=嵌入模式, 'extract'=提取模式
-if 'current_mode' not in st.session_state:
-    st.session_state.current_mode = None
+def log_prefetch_failure(future):
+    """
+    功能:
+        背景下載結束時的回呼：工作拋出例外就記錄下來（預先下載失敗不影響頁面，之後會在前景重新下載）
+    """
+    error = future.exception()
+    if error is not None:
+        logger.warning("背景預先下載圖片失敗：%r", error)
 
-# ==================== 側邊欄 - 對象管理 ====================
-# 只在嵌入/提取模式下顯示（首頁不顯示）
-if st.session_state.current_mode is not None:
-    # 根據當前模式設定顏色（嵌入=藍色，提取=粉色）
-    sidebar_title_color = "#4A6B8A" if st.session_state.current_mode == 'embed' else "#7D5A6B"
+def prefetch_images(pexels_ids, size):
+    """
+    功能:
+        在背景平行下載多張圖片，預先存到 IMAGE_CACHE_DIR
     
-    with st.sidebar:
-        # 側邊欄標題樣式 + 關閉按鈕
-        st.markdown(f"""
-        <style>
-        section[data-testid="stSidebar"] details summary span p {{ font-size: 22px !important; }}
-        #built-contacts-title {{ font-size: 28px !important; font-weight: bold !important; margin-bottom: 10px !important; text-align: center !important; }}
-        [data-testid="stSidebar"] .sidebar-title {{ font-size: 36px !important; margin-bottom: 15px !important; color: {sidebar_title_color} !important; font-weight: bold !important; text-align: center !important; }}
-        </style>
-        <div id="sidebar-close-btn" style="position: absolute; top: -15px; right: 0px; 
-            width: 30px; height: 30px; background: #e0e0e0; border-radius: 50%; 
-            display: flex; align-items: center; justify-content: center; 
-            cursor: pointer; font-size: 18px; color: #666; z-index: 9999;">✕</div>
-        """, unsafe_allow_html=True)
-        
-        st.markdown(f'<div class="sidebar-title" style="color: {sidebar_title_color} !important;">對象管理</div>', unsafe_allow_html=True)
-        
-        contacts = st.session_state.contacts
-        style_options = ["選擇"] + list(STYLE_CATEGORIES.keys())
-        
-         # ----- 新增對象區塊 -----
-        with st.expander("新增對象", expanded=False):
-            add_counter = st.session_state.get('add_contact_counter', 0)
-            new_name = st.text_input("名稱", key=f"sidebar_new_name_{add_counter}")
-            new_style = st.selectbox("綁定風格", style_options, key=f"sidebar_new_style_{add_counter}")
-
-            # 檢查是否可以新增（名稱不為空 + 已選擇風格）
-            can_add = new_name and new_name.strip() and new_style != "選擇"
-            if st.button("新增", key="sidebar_add_btn", use_container_width=True, disabled=not can_add, type="primary" if can_add else "secondary"):
-                try:
-                    new_key = generate_contact_key()  # 生成對象專屬密鑰
-                    st.session_state.contacts[new_name.strip()] = {
-                        "style": new_style,
-                        "key": new_key
-                    }
-                    save_contacts(st.session_state.contacts)  # 儲存到 Supabase
-                    st.toast(f"已新增「{new_name.strip()}」")
-                    st.session_state.add_contact_counter = add_counter + 1
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"新增失敗：{e}")
-        
-        st.markdown("---")
-        st.markdown('<div id="built-contacts-title">對象列表</div>', unsafe_allow_html=True)
+    參數:
+        pexels_ids: Pexels 圖片 ID 列表
+        size: 圖片尺寸
+    
+    原理:
+        圖片下載是等待網路的 I/O 工作，交給執行緒池平行進行，不阻塞目前的頁面；
+        背景執行緒沒有 Streamlit 的執行環境，因此只下載並寫檔，不呼叫 download_image_cached；
+        使用者按下嵌入時，download_image_cached 會先讀到硬碟上的檔案，不必再等下載
+        HTTP 連線在目前的執行緒取得後傳給背景工作；同一個工作階段中已送出的 (ID, 尺寸) 不再重複送出
+    """
+    submitted = st.session_state.setdefault('prefetched_images', set())
+    executor = get_prefetch_executor()
+    session = get_http_session()
+    for pexels_id in pexels_ids:
+        if (pexels_id, size) not in submitted:
+            submitted.add((pexels_id, size))
+            future = executor.submit(prefetch_image_file, pexels_id, size, session)
+            future.add_done_callback(log_prefetch_failure)
 
-        # ----- 對象列表區塊 -----
-        if contacts:
-            for name, contact_data in contacts.items():
-                # 取得風格（支援新舊格式）
-                style = get_contact_style(contacts, name)
-                style_display = STYLE_CATEGORIES.get(style, style) if style else "未綁定"
-                display_text = f"{name}（{style_display}）"
-                
-                with st.expander(display_text, expanded=False):
-                    new_nickname = st.text_input("名稱", value=name, key=f"new_name_{name}")
-                    new_style_edit = st.selectbox("風格", style_options, 
-                        index=style_options.index(style) if style in style_options else 0,
-                        key=f"new_style_{name}")
-                    
-                    has_change = (new_nickname.strip() != name) or (new_style_edit != style)
+def download_image_by_id(pexels_id, size):
+    """
+    功能:
+        下載指定 ID 和尺寸的圖片，並轉換為 RGB 和灰階版本
+    
+    參數:
+        pexels_id: Pexels 圖片 ID
+        size: 目標圖片尺寸
+    
+    返回:
+        tuple: (RGB 圖片, 灰階圖片)，若下載失敗則返回漸層備用圖
+    """
+    image_data = download_image_cached(pexels_id, size)
+    
+    if image_data:
+        img = Image.open(BytesIO(image_data))
+        if img.mode != 'RGB':  # Pexels 的 JPEG 通常已是 RGB，不必再轉換一次
+            img = img.convert('RGB')
+        if img.size[0] != size or img.size[1] != size:
+            img = img.resize((size, size), Image.LANCZOS)
+        img_gray = img.convert('L')
+        return img, img_gray
+    
+    img = generate_gradient_image(size, (100, 150, 200), (150, 200, 250))
+    return img, img.convert('L')
 
-                    # 儲存修改按鈕
-                    if st.button("儲存修改", key=f"save_{name}", use_container_width=True, type="primary" if has_change else "secondary"):
-                        old_key = get_contact_key(contacts, name)  # 保留原有的密鑰
-                        if new_nickname.strip() != name:
-                            del st.session_state.contacts[name]
-                        st.session_state.contacts[new_nickname.strip()] = {
-                            "style": new_style_edit if new_style_edit != "選擇" else None,
-                            "key": old_key or generate_contact_key()
-                        }
-                        save_contacts(st.session_state.contacts)
-                        st.rerun()
+# ==================== 圖像容量計算 ====================
+def calculate_required_bits_for_image(image):
+    """
+    功能:
+        計算圖像作為機密時所需的位元數
+    
+    參數:
+        image: PIL Image 物件
+    
+    返回:
+        tuple: (所需位元數, 圖像尺寸)
+    """
+    size, mode = image.size, image.mode
+    is_color = mode not in ['L', '1', 'LA']
+    
+    # 判斷是否有透明通道
+    if not is_color:
+        has_alpha = False
+    elif mode == 'P':
+        temp_img = image.convert('RGBA')
+        alpha_channel = temp_img.split()[-1]
+        has_alpha = alpha_channel.getextrema()[0] < 255
+    elif mode in ['RGBA', 'PA']:
+        has_alpha = True
+    else:
+        has_alpha = False
+    
+    # 計算所需位元數
+    header_bits = 34
+    if is_color:
+        bits_per_pixel = 32 if has_alpha else 24
+    else:
+        bits_per_pixel = 8
+    
+    required_bits = header_bits + size[0] * size[1] * bits_per_pixel
+    
+    return required_bits, size
 
-                    # 刪除按鈕
-                    if st.button("刪除", key=f"del_{name}", use_container_width=True):
-                        del st.session_state.contacts[name]
-                        save_contacts(st.session_state.contacts)
-                        st.rerun()
-        else:
-            st.markdown('<p style="font-size: 22px; color: #666;">尚無對象</p>', unsafe_allow_html=True)
+# ==================== Streamlit 頁面配置 ====================
+# 設定頁面標題、圖示、寬螢幕模式、隱藏側邊欄
+st.set_page_config(page_title="🔐 高效能無載體之機密編碼技術", page_icon="🔐", layout="wide", initial_sidebar_state="collapsed")
 
-# ==================== 主要邏輯：根據 current_mode 顯示不同頁面 ====================
-if st.session_state.current_mode is None:
-    # ==================== 首頁 ====================
+# ==================== CSS 樣式 ====================
+# 包含：背景圖片、隱藏 Streamlit 預設元素、側邊欄樣式、按鈕樣式、表單樣式等
+@st.cache_data(show_spinner=False)
+def load_css(css_name):
+    """
+    功能:
+        讀取 static 資料夾的 CSS 檔（快取結果，重新執行頁面時不必再讀檔）
+    
+    參數:
+        css_name: CSS 檔名（不含副檔名）
+    
+    返回:
+        str: CSS 內容，若檔案不存在則返回空字串
+    """
+    css_path = os.path.join("static", f"{css_name}.css")
+    if os.path.exists(css_path):
+        with open(css_path, "r", encoding="utf-8") as f:
+            return minify_css(f.read())
+    return ""
 
-    # ----- 首頁專用樣式：禁止滾動、全螢幕顯示 -----
-    st.markdown("""
-    <style>
-    html, body, [data-testid="stAppViewContainer"], .main, [data-testid="stMain"] {
-        overflow: hidden !important;
-        height: 100vh !important;
-    }
-    .block-container {
-        padding-bottom: 0 !important;
-        height: 100vh !important;
-        overflow: hidden !important;
-    }
-    iframe {
-        height: calc(100vh - 20px) !important;
-        min-height: 700px !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+# CSS 的字串、註解、標點（含前後空白）、連續空白（依序比對，字串內容原樣保留）
+CSS_TOKEN_PATTERN = re.compile(
+    r'("(?:\\.|[^"\\])*"|' + r"'(?:\\.|[^'\\])*')"   # 1: 字串
+    r'|/\*.*?\*/'                                       # 註解
+    r'|\s*(?:;(?=\s*\}))?\s*([{};,>])\s*'                # 2: 標點（區塊最後一個分號一併刪除）
+    r'|\s+',                                             # 連續空白
+    re.S
+)
 
-    # ----- 載入首頁卡片用的圖示 -----
+def minify_css(css):
+    """
+    功能:
+        壓縮 CSS：刪除註解和多餘空白（檔案保留可讀的排版，送到瀏覽器的是壓縮後的版本）
+    
+    參數:
+        css: CSS 原始碼
+    
+    返回:
+        str: 壓縮後的 CSS
+    
+    原理:
+        由左到右依序比對字串、註解、標點、空白：
+        1. 引號內的字串原樣保留（例如 [data-testid="a b"]、url('...')）
+        2. 註解刪除
+        3. { } ; , > 前後的空白刪除，區塊最後一個宣告的分號也刪除（;} → }）
+        4. 其餘連續空白（含換行）縮成 1 個空格，選擇器中有意義的空白（子孫選擇器）會保留
+    """
+    def replace_token(match):
+        if match.group(1):            # 字串：原樣保留
+            return match.group(1)
+        if match.group(2):            # 標點：去掉前後空白
+            return match.group(2)
+        if match.group(0).startswith('/*'):
+            return ''                 # 註解：刪除
+        return ' '                    # 空白：縮成 1 個
+    
+    return CSS_TOKEN_PATTERN.sub(replace_token, css).strip()
+
+@st.cache_data(show_spinner=False)
+def compress_html(page_html):
+    """
+    功能:
+        把要交給 components.html 的大段 HTML 先用 gzip 壓縮，包成一小段自我解壓的 script
+    
+    參數:
+        page_html: 完整的 HTML 文件字串
+    
+    返回:
+        str: 只含一個 <script> 的 HTML，瀏覽器載入後解壓並寫回原本的文件
+    
+    原理:
+        1. Python 端 gzip 壓縮後轉 base64（快取結果，同一份 HTML 只壓縮一次）
+        2. 瀏覽器端用 fetch 讀取 data URI，經 DecompressionStream('gzip') 解壓
+        3. document.open/write/close 用解壓出的 HTML 取代 iframe 內容（頁面內的 script 會照常執行）
+        瀏覽器內建的 DecompressionStream 只支援 gzip/deflate，因此不使用 Brotli
+    """
+    data = base64.b64encode(gzip.compress(page_html.encode('utf-8'), compresslevel=9)).decode()
+    return f"""<script>
+fetch('data:application/gzip;base64,{data}')
+    .then(r => new Response(r.body.pipeThrough(new DecompressionStream('gzip'))).text())
+    .then(page => {{ document.open(); document.write(page); document.close(); }});
+</script>"""
+
+@st.cache_data(show_spinner=False)
+def build_home_html():
+    """
+    功能:
+        建立首頁的 HTML（標題 + 嵌入/提取卡片 + 組員名單），壓縮後快取
+    
+    返回:
+        str: 交給 components.html 的 HTML（已經過 compress_html）
+    
+    原理:
+        首頁內容只取決於 4 個固定的圖示，整段 HTML 只在第一次呼叫時組合並壓縮，
+        之後重新執行頁面時直接取用快取，不必重新組合約 60 KB 的字串
+    """
+    # 載入首頁卡片用的圖示
     icon_secret = get_icon_base64("secret-message")
     icon_image = get_icon_base64("public-image")
     icon_arrow = get_icon_base64("arrow")
     icon_zcode = get_icon_base64("z-code")
     
-    # ----- 首頁 HTML：標題 + 嵌入/提取卡片 + 組員名單 -----
-    components.html(f"""
+    return compress_html(f"""
     <!DOCTYPE html>
     <html>
     <head>
@@ -1372,58 +1062,140 @@ if st.session_state.current_mode is None:
     <script>
     const parentDoc = window.parent.document;
 
-    // 點擊嵌入卡片 → 觸發隱藏的「開始嵌入」按鈕
-    function clickEmbed() {{
-        const buttons = parentDoc.querySelectorAll('button');
-        buttons.forEach(b => {{ if (b.innerText.includes('嵌入')) b.click(); }});
+    // 隱藏的「開始嵌入」「開始提取」按鈕由 hideHomeButtons 標上 data-role，直接用屬性找，不必掃描全部按鈕
+    function clickHomeButton(role) {{
+        const button = parentDoc.querySelector(`button[data-role="${{role}}"]`);
+        if (button) button.click();
     }}
 
-    // 點擊提取卡片 → 觸發隱藏的「開始提取」按鈕
-    function clickExtract() {{
-        const buttons = parentDoc.querySelectorAll('button');
-        buttons.forEach(b => {{ if (b.innerText.includes('提取')) b.click(); }});
-    }}
+    // 點擊嵌入卡片 → 觸發隱藏的「開始嵌入」按鈕
+    function clickEmbed() {{ clickHomeButton('embed'); }}
 
-    // 隱藏 Streamlit 預設的標籤和按鈕
-    function hideStreamlitBadges() {{
-        const selectors = [
-            '[class*="viewerBadge"]',
-            'a[href*="streamlit.io"]',
-            '[class*="StatusWidget"]',
-            '[data-testid="manage-app-button"]',
-            '.stAppDeployButton',
-            'section[data-testid="stStatusWidget"]',
-            '[class*="stDeployButton"]',
-            '[class*="AppDeployButton"]'
-        ];
-        selectors.forEach(sel => {{
-            parentDoc.querySelectorAll(sel).forEach(el => {{
-                el.style.display = 'none';
-            }});
-        }});
-    }}
-    
-    hideStreamlitBadges();
-    setTimeout(hideStreamlitBadges, 500);
-    setTimeout(hideStreamlitBadges, 1000);
-    setTimeout(hideStreamlitBadges, 2000);
+    // 點擊提取卡片 → 觸發隱藏的「開始提取」按鈕
+    function clickExtract() {{ clickHomeButton('extract'); }}
     </script>
     </body>
     </html>
-    """, height=900, scrolling=False)
+    """)
+
+st.markdown(f"<style>\n{load_css('app')}</style>", unsafe_allow_html=True)
+
+# ==================== 初始化狀態 ====================
+# current_mode: None=首頁, 'embed'=嵌入模式, 'extract'=提取模式
+if 'current_mode' not in st.session_state:
+    st.session_state.current_mode = None
+
+# ==================== 側邊欄 - 對象管理 ====================
+# 只在嵌入/提取模式下顯示（首頁不顯示）
+if st.session_state.current_mode is not None:
+    # 根據當前模式設定顏色（嵌入=藍色，提取=粉色）
+    sidebar_title_color = "var(--embed-blue)" if st.session_state.current_mode == 'embed' else "var(--extract-pink)"
     
-    # ----- 動態調整 iframe 高度（適應不同螢幕）-----
-    components.html("""
-    <script>
-    (function() {
-        const iframe = window.frameElement;
-        if (iframe) {
-            iframe.style.height = 'calc(100vh - 50px)';
-            iframe.style.minHeight = '700px';
-        }
-    })();
-    </script>
-    """, height=0)
+    with st.sidebar:
+        # 側邊欄標題樣式 + 關閉按鈕
+        st.markdown(f"""
+        <style>
+        section[data-testid="stSidebar"] details summary span p {{ font-size: 22px !important; }}
+        #built-contacts-title {{ font-size: 28px !important; font-weight: bold !important; margin-bottom: 10px !important; text-align: center !important; }}
+        [data-testid="stSidebar"] .sidebar-title {{ font-size: 36px !important; margin-bottom: 15px !important; color: {sidebar_title_color} !important; font-weight: bold !important; text-align: center !important; }}
+        </style>
+        <div id="sidebar-close-btn" style="position: absolute; top: -15px; right: 0px; 
+            width: 30px; height: 30px; background: #e0e0e0; border-radius: 50%; 
+            display: flex; align-items: center; justify-content: center; 
+            cursor: pointer; font-size: 18px; color: #666; z-index: 9999;">✕</div>
+        """, unsafe_allow_html=True)
+        
+        st.markdown(f'<div class="sidebar-title" style="color: {sidebar_title_color} !important;">對象管理</div>', unsafe_allow_html=True)
+        
+        contacts = st.session_state.contacts
+        style_options = ["選擇"] + list(STYLE_CATEGORIES.keys())
+        
+         # ----- 新增對象區塊 -----
+        with st.expander("新增對象", expanded=False):
+            add_counter = st.session_state.get('add_contact_counter', 0)
+            new_name = st.text_input("名稱", key=f"sidebar_new_name_{add_counter}")
+            new_style = st.selectbox("綁定風格", style_options, key=f"sidebar_new_style_{add_counter}")
+
+            # 檢查是否可以新增（名稱不為空 + 已選擇風格）
+            can_add = new_name and new_name.strip() and new_style != "選擇"
+            if st.button("新增", key="sidebar_add_btn", use_container_width=True, disabled=not can_add, type="primary" if can_add else "secondary"):
+                try:
+                    new_key = generate_contact_key()  # 生成對象專屬密鑰
+                    st.session_state.contacts[new_name.strip()] = {
+                        "style": new_style,
+                        "key": new_key
+                    }
+                    save_contacts(st.session_state.contacts)  # 儲存到 Supabase
+                    st.toast(f"已新增「{new_name.strip()}」")
+                    st.session_state.add_contact_counter = add_counter + 1
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"新增失敗：{e}")
+        
+        st.markdown("---")
+        st.markdown('<div id="built-contacts-title">對象列表</div>', unsafe_allow_html=True)
+
+        # ----- 對象列表區塊 -----
+        if contacts:
+            for name, contact_data in contacts.items():
+                # 取得風格（支援新舊格式）
+                style = get_contact_style(contacts, name)
+                style_display = STYLE_CATEGORIES.get(style, style) if style else "未綁定"
+                display_text = f"{name}（{style_display}）"
+                
+                with st.expander(display_text, expanded=False):
+                    new_nickname = st.text_input("名稱", value=name, key=f"new_name_{name}")
+                    new_style_edit = st.selectbox("風格", style_options, 
+                        index=style_options.index(style) if style in style_options else 0,
+                        key=f"new_style_{name}")
+                    
+                    has_change = (new_nickname.strip() != name) or (new_style_edit != style)
+
+                    # 儲存修改按鈕
+                    if st.button("儲存修改", key=f"save_{name}", use_container_width=True, type="primary" if has_change else "secondary"):
+                        old_key = get_contact_key(contacts, name)  # 保留原有的密鑰
+                        if new_nickname.strip() != name:
+                            del st.session_state.contacts[name]
+                        st.session_state.contacts[new_nickname.strip()] = {
+                            "style": new_style_edit if new_style_edit != "選擇" else None,
+                            "key": old_key or generate_contact_key()
+                        }
+                        save_contacts(st.session_state.contacts)
+                        st.rerun()
+
+                    # 刪除按鈕
+                    if st.button("刪除", key=f"del_{name}", use_container_width=True):
+                        del st.session_state.contacts[name]
+                        save_contacts(st.session_state.contacts)
+                        st.rerun()
+        else:
+            st.markdown('<p style="font-size: 22px; color: #666;">尚無對象</p>', unsafe_allow_html=True)
+
+# ==================== 主要邏輯：根據 current_mode 顯示不同頁面 ====================
+if st.session_state.current_mode is None:
+    # ==================== 首頁 ====================
+
+    # ----- 首頁專用樣式：禁止滾動、全螢幕顯示 -----
+    st.markdown("""
+    <style>
+    html, body, [data-testid="stAppViewContainer"], .main, [data-testid="stMain"] {
+        overflow: hidden !important;
+        height: 100vh !important;
+    }
+    .block-container {
+        padding-bottom: 0 !important;
+        height: 100vh !important;
+        overflow: hidden !important;
+    }
+    iframe {
+        height: calc(100vh - 20px) !important;
+        min-height: 700px !important;
+    }
+    </style>
+    """, unsafe_allow_html=True)
+
+    # ----- 首頁 HTML：標題 + 嵌入/提取卡片 + 組員名單（內容固定，只建立一次）-----
+    components.html(build_home_html(), height=900, scrolling=False)
     
     # ----- 隱藏的 Streamlit 按鈕（供 HTML 卡片觸發）-----
     col1, col2 = st.columns(2)
@@ -1436,22 +1208,36 @@ if st.session_state.current_mode is None:
             st.session_state.current_mode = 'extract'
             st.rerun()
 
-    # ----- 用 JS 把 Streamlit 按鈕移到螢幕外（視覺上隱藏）-----
+    # ----- 首頁輔助 JS（合併成一個 iframe）：調整 iframe 高度 + 把 Streamlit 按鈕移到螢幕外（視覺上隱藏）-----
     components.html("""
 <script>
+// 動態調整 iframe 高度（適應不同螢幕）
+(function() {
+    const iframe = window.frameElement;
+    if (iframe) {
+        iframe.style.height = 'calc(100vh - 50px)';
+        iframe.style.minHeight = '700px';
+    }
+})();
+
 const doc = window.parent.document;
+// 同時標上 data-role，供首頁卡片直接找到按鈕（用 textContent，不觸發版面計算）
 function hideHomeButtons() {
     const buttons = doc.querySelectorAll('button');
     buttons.forEach(btn => {
-        const text = btn.innerText || btn.textContent;
+        const text = btn.textContent;
         if (text.includes('開始嵌入') || text.includes('開始提取')) {
+            btn.dataset.role = text.includes('開始嵌入') ? 'embed' : 'extract';
             btn.style.cssText = 'position:fixed!important;top:-9999px!important;left:-9999px!important;opacity:0!important;';
         }
     });
 }
 hideHomeButtons();
 setTimeout(hideHomeButtons, 100);
-new MutationObserver(hideHomeButtons).observe(doc.body, { childList: true, subtree: true });
+// iframe 被移除（換頁）時停止監聽，避免 observer 留在父頁面越積越多
+const observer = new MutationObserver(hideHomeButtons);
+observer.observe(doc.body, { childList: true, subtree: true });
+window.addEventListener('pagehide', () => observer.disconnect());
 </script>
 """, height=0)
 
@@ -1523,15 +1309,8 @@ elif st.session_state.current_mode == 'embed':
                 qr_content = f"{style_num}-{img_num}-{img_size}|{z_text}"
                 
                 try:
-                    # 嘗試生成 QR Code
-                    qr = qrcode.QRCode(version=None, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=2)
-                    qr.add_data(qr_content)
-                    qr.make(fit=True)
-                    qr_pil = qr.make_image(fill_color="black", back_color="white").convert('RGB')
-                    
-                    buf = BytesIO()
-                    qr_pil.save(buf, format='PNG')
-                    qr_bytes = buf.getvalue()
+                    # 嘗試生成 QR Code（內容太長時會拋出例外，改用 Z碼圖）
+                    qr_bytes = generate_qr_png(qr_content)
                     
                     st.markdown('<p style="font-size: 38px; font-weight: bold; color: #443C3C; margin-bottom: 25px;">Z碼圖</p>', unsafe_allow_html=True)
                     st.image(qr_bytes, width=200)
@@ -1644,7 +1423,10 @@ elif st.session_state.current_mode == 'embed':
     setup();
     setTimeout(setup, 100);
     setTimeout(setup, 500);
-    new MutationObserver(setup).observe(doc.body, { childList: true, subtree: true });
+    // iframe 被移除（換頁）時停止監聽，避免 observer 留在父頁面越積越多
+    const observer = new MutationObserver(setup);
+    observer.observe(doc.body, { childList: true, subtree: true });
+    window.addEventListener('pagehide', () => observer.disconnect());
 })();
 </script>
 """, height=0)
@@ -1858,6 +1640,9 @@ elif st.session_state.current_mode == 'embed':
                     
                     selected_image = images[img_idx]
                     
+                    # 背景預先下載這個風格的圖像（選定尺寸），嵌入時直接使用快取
+                    prefetch_images([image["id"] for image in images], selected_size)
+                    
                     capacity = calculate_capacity(selected_size, selected_size)
                     usage = secret_bits_needed / capacity * 100
                     capacity_ok = secret_bits_needed <= capacity
@@ -2311,7 +2096,10 @@ else:
     }
     setup();
     setTimeout(setup, 100);
-    new MutationObserver(setup).observe(doc.body, { childList: true, subtree: true });
+    // iframe 被移除（換頁）時停止監聽，避免 observer 留在父頁面越積越多
+    const observer = new MutationObserver(setup);
+    observer.observe(doc.body, { childList: true, subtree: true });
+    window.addEventListener('pagehide', () => observer.disconnect());
 })();
 </script>
 """, height=0)
@@ -2403,52 +2191,25 @@ else:
                     success_msg = ""
                     error_msg = ""
                     
-                    # ----- 先嘗試 QR Code 解碼 -----
+                    image_bytes = extract_file.getvalue()
+                    qr_decoded = None
+                    qr_fields = None
+                    
+                    # ----- 先嘗試 QR Code 解碼（縮小版和原圖，不做前處理）-----
                     try:
-                        decode_qr = load_pyzbar()
-                        decoded = decode_qr(uploaded_img)
-                        if decoded:
-                            qr_content = decoded[0].data.decode('utf-8')
-                            if '|' in qr_content:
-                                header, z_text = qr_content.split('|', 1)
-                                parts = header.split('-')
-                                if len(parts) == 3:
-                                    # 新格式: 風格編號-圖像編號-尺寸
-                                    extract_style_num = int(parts[0])
-                                    extract_img_num = int(parts[1])
-                                    extract_img_size = int(parts[2])
-                                    extract_z_text = z_text
-                                    style_name = NUM_TO_STYLE.get(extract_style_num, "建築")
-                                    images = IMAGE_LIBRARY.get(style_name, [])
-                                    img_name = images[extract_img_num - 1]['name'] if extract_img_num <= len(images) else str(extract_img_num)
-                                    success_msg = f"Z碼圖額外資訊：<br>風格：{extract_style_num}. {style_name}，載體圖像：{extract_img_num}（{img_name}），尺寸：{extract_img_size}×{extract_img_size}"
-                                    detected = True
-                                elif len(parts) == 2:
-                                    # 舊格式: 圖像編號-尺寸（預設風格=建築）
-                                    extract_style_num = 1 
-                                    extract_img_num = int(parts[0])
-                                    extract_img_size = int(parts[1])
-                                    extract_z_text = z_text
-                                    style_name = NUM_TO_STYLE.get(extract_style_num, "建築")
-                                    images = IMAGE_LIBRARY.get(style_name, [])
-                                    img_name = images[extract_img_num - 1]['name'] if extract_img_num <= len(images) else str(extract_img_num)
-                                    success_msg = f"Z碼圖額外資訊：<br>風格：{extract_style_num}. {style_name}，載體圖像：{extract_img_num}（{img_name}），尺寸：{extract_img_size}×{extract_img_size}"
-                                    detected = True
+                        qr_decoded = decode_qr_cached(image_bytes)
+                        qr_fields = parse_qr_z_code(qr_decoded)
                     except Exception as e:
                         error_msg = f"QR: {str(e)}"
                     
                     # ----- QR 失敗則嘗試圖像 Z碼解碼 -----
-                    if not detected:
+                    if qr_fields is None:
                         try:
                             z_bits, style_num, img_num, img_size = image_to_z_with_header(uploaded_img)
                             extract_style_num = style_num
                             extract_img_num = img_num
                             extract_img_size = img_size
                             extract_z_text = z_to_text(z_bits)
-                            style_name = NUM_TO_STYLE.get(extract_style_num, "建築")
-                            images = IMAGE_LIBRARY.get(style_name, [])
-                            img_name = images[extract_img_num - 1]['name'] if extract_img_num <= len(images) else str(extract_img_num)
-                            success_msg = f"Z碼圖額外資訊：<br>風格：{extract_style_num}. {style_name}，載體圖像：{extract_img_num}（{img_name}），尺寸：{extract_img_size}×{extract_img_size}"
                             detected = True
                         except Exception as e:
                             if error_msg:
@@ -2456,10 +2217,24 @@ else:
                             else:
                                 error_msg = str(e)
                     
+                    # ----- 兩者都失敗且原圖掃不到 QR Code，才套用前處理再掃（一般 Z碼圖不會走到這裡）-----
+                    if qr_fields is None and not detected and qr_decoded == []:
+                        try:
+                            qr_fields = parse_qr_z_code(decode_qr_preprocessed(image_bytes))
+                        except Exception as e:
+                            error_msg += f", QR: {str(e)}"
+                    
+                    if qr_fields is not None:
+                        extract_style_num, extract_img_num, extract_img_size, extract_z_text = qr_fields
+                        detected = True
+                    
                     # ----- 顯示識別結果 -----
                     if detected:
-                        img_bytes = extract_file.getvalue()
-                        img_b64 = base64.b64encode(img_bytes).decode()
+                        style_name = NUM_TO_STYLE.get(extract_style_num, "建築")
+                        images = IMAGE_LIBRARY.get(style_name, [])
+                        img_name = images[extract_img_num - 1]['name'] if extract_img_num <= len(images) else str(extract_img_num)
+                        success_msg = f"Z碼圖額外資訊：<br>風格：{extract_style_num}. {style_name}，載體圖像：{extract_img_num}（{img_name}），尺寸：{extract_img_size}×{extract_img_size}"
+                        img_b64 = base64.b64encode(image_bytes).decode()
                         st.markdown(f'''
                         <div style="display: flex; align-items: center; gap: 20px; margin-top: 10px;">
                             <div style="flex-shrink: 0;">
@@ -2569,7 +2344,7 @@ else:
                             else:
                                 buf = BytesIO()
                                 secret.save(buf, format='PNG')
-                                is_garbled = 'error' in info or is_likely_garbled_image(buf.getvalue())
+                                is_garbled = 'error' in info or is_likely_garbled_image(secret)  # 直接用提取出的圖像，不必從 PNG 再解碼
                                 st.session_state.extract_result = {
                                     'success': True, 
                                     'type': 'image', 
@@ -2608,3 +2383,7 @@ else:
         setTimeout(fixExtractBackButton, 300);
         </script>
         """, height=0)
+
+# ==================== 非首屏樣式（側邊欄面板、下拉選單列表）====================
+# 放在頁面最後才送出：主要內容先繪製，展開側邊欄或下拉選單時才會用到這些規則
+st.markdown(f"<style>\n{load_css('app-deferred')}</style>", unsafe_allow_html=True)
@@ -249,7 +249,7 @@ def demo_complete_process():
     print_section("步驟5: 嵌入機密內容並生成 Z 碼")
 
     print(f"機密內容: \"{secret_message}\"")
-    content_bits = text_to_binary(secret_message)
+    content_bits = text_to_binary(secret_message).tolist()
     print(f"UTF-8 編碼: {content_bits}")
     print(f"內容需要 {len(content_bits)} 位元")
     print()
@@ -284,7 +284,7 @@ def demo_complete_process():
 
     print("-" * 50)
     print()
-    print(f"Z 碼 ({len(z_bits)} bits): {z_bits}")
+    print(f"Z 碼 ({len(z_bits)} bits): {z_bits.tolist()}")
     print()
 
     # ==================== 步驟6: Z碼編碼 ====================
@@ -299,7 +299,7 @@ def demo_complete_process():
     print("  每 8 位元轉成 1 個像素值:")
     pixels = []
     for i in range(0, len(z_bits), 8):
-        byte = z_bits[i:i+8]
+        byte = z_bits[i:i+8].tolist()
         if len(byte) < 8:
             byte = byte + [0] * (8 - len(byte))
         pixel_value = binary_to_int(byte)
@@ -1,6 +1,8 @@
 # 建立 mapping.py → 映射模組
 # MSB 映射表與映射函式
 
+import numpy as np
+
 # ==================== MSB 映射表 ====================
 # 正向映射表（論文的表 1）：(M, MSB) → Z
 MAPPING_TABLE = {
@@ -18,6 +20,11 @@ REVERSE_MAPPING_TABLE = {
     (0, 1): 0
 }
 
+# 查表陣列：由上面兩張映射表轉成 2×2 陣列，用位元值直接索引（不必建立 tuple 查 dict）
+# MAPPING_ARRAY[M, MSB] → Z，REVERSE_MAPPING_ARRAY[Z, MSB] → M
+MAPPING_ARRAY = np.array([[MAPPING_TABLE[(m, msb)] for msb in (0, 1)] for m in (0, 1)], dtype=np.uint8)
+REVERSE_MAPPING_ARRAY = np.array([[REVERSE_MAPPING_TABLE[(z, msb)] for msb in (0, 1)] for z in (0, 1)], dtype=np.uint8)
+
 # ==================== 映射函式 ====================
 def map_to_z(secret_bit, msb):
     """
@@ -25,11 +32,11 @@ def map_to_z(secret_bit, msb):
         正向映射：將秘密位元 M 與 MSB 結合，轉換為 Z 碼
     
     參數:
-        secret_bit: 秘密位元
-        msb: 對應平均值的 MSB
+        secret_bit: 秘密位元（或位元陣列）
+        msb: 對應平均值的 MSB（或 MSB 陣列，長度與 secret_bit 相同）
     
     返回:
-        z_bit: 映射後的 Z 碼位元
+        z_bit: 映射後的 Z 碼位元（輸入為陣列時回傳陣列）
     
     映射表:
         (M=0, MSB=0) → Z=1
@@ -37,8 +44,9 @@ def map_to_z(secret_bit, msb):
         (M=1, MSB=0) → Z=0
         (M=1, MSB=1) → Z=1
     """
-    key = (secret_bit, msb)
-    z_bit = MAPPING_TABLE[key]
+    z_bit = MAPPING_ARRAY[secret_bit, msb]
+    if np.ndim(z_bit) == 0:
+        z_bit = int(z_bit)  # 單一位元維持回傳 int
     
     return z_bit
 
@@ -48,11 +56,11 @@ def map_from_z(z_bit, msb):
         反向映射：使用 Z 碼和 MSB 還原秘密位元 M
     
     參數:
-        z_bit: Z 碼位元
-        msb: 對應平均值的 MSB
+        z_bit: Z 碼位元（或位元陣列）
+        msb: 對應平均值的 MSB（或 MSB 陣列，長度與 z_bit 相同）
     
     返回:
-        secret_bit: 還原的秘密位元
+        secret_bit: 還原的秘密位元（輸入為陣列時回傳陣列）
     
     反向映射表:
         (Z=1, MSB=0) → M=0
@@ -60,7 +68,8 @@ def map_from_z(z_bit, msb):
         (Z=1, MSB=1) → M=1
         (Z=0, MSB=1) → M=0
     """
-    key = (z_bit, msb)
-    secret_bit = REVERSE_MAPPING_TABLE[key]
+    secret_bit = REVERSE_MAPPING_ARRAY[z_bit, msb]
+    if np.ndim(secret_bit) == 0:
+        secret_bit = int(secret_bit)  # 單一位元維持回傳 int
     
     return secret_bit
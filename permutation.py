@@ -3,6 +3,48 @@
 
 import numpy as np
 import hashlib
+from functools import lru_cache
+
+def generate_contact_permutation(contact_key, q_length=7):
+    """
+    功能:
+        由 contact_key 產生固定的置換順序，用於對 Q 進行額外置換
+    
+    參數:
+        contact_key: 對象專屬密鑰（字串）
+        q_length: Q 的長度，預設 7
+    
+    返回:
+        perm_order: 置換順序列表（0-based 索引）
+    
+    原理:
+        同一個 contact_key 永遠產生同一個置換順序
+        結果只取決於 (contact_key, q_length)，因此快取起來，
+        逐區塊呼叫時不必每次重新計算 SHA-256 與建立隨機數生成器
+    """
+    return list(_contact_permutation_cached(contact_key, q_length))  # 回傳新列表，避免呼叫端改到快取內容
+
+@lru_cache(maxsize=64)
+def _contact_permutation_cached(contact_key, q_length):
+    """
+    功能:
+        generate_contact_permutation 的快取實作，回傳不可變的 tuple
+    """
+    # 步驟 1：用 SHA-256 把 contact_key 轉成固定的 hash 值
+    # 例如 "Alice" → 32 bytes 的 hash
+    key_hash = hashlib.sha256(contact_key.encode('utf-8')).digest()
+
+    # 步驟 2：取 hash 的前 4 bytes 作為種子
+    # 同一個 contact_key 永遠產生同一個種子
+    perm_seed = int.from_bytes(key_hash[:4], 'big')
+    
+    # 步驟 3：用種子建立隨機數生成器，生成置換順序
+    # 同一個種子永遠產生同一個置換順序
+    rng = np.random.default_rng(perm_seed)
+    perm_order = list(range(q_length))  # 建立索引列表 [0,1,2,3,4,5,6]
+    rng.shuffle(perm_order)             # 打亂順序，例如 [3,0,5,1,6,2,4]
+    
+    return tuple(perm_order)
 
 def generate_Q_from_block(block, q_length=7, contact_key=None):
     """
@@ -58,24 +100,10 @@ def generate_Q_from_block(block, q_length=7, contact_key=None):
     
     # 用 contact_key 對 Q 進行額外置換
     if contact_key:
-        # 步驟 1：用 SHA-256 把 contact_key 轉成固定的 hash 值
-        # 例如 "Alice" → 32 bytes 的 hash
-        key_hash = hashlib.sha256(contact_key.encode('utf-8')).digest()
-
-        # 步驟 2：取 hash 的前 4 bytes 作為種子
-        # 同一個 contact_key 永遠產生同一個種子
-        perm_seed = int.from_bytes(key_hash[:4], 'big')
-        
-        # 步驟 3：用種子建立隨機數生成器，生成置換順序
-        # 同一個種子永遠產生同一個置換順序
-        rng = np.random.default_rng(perm_seed)
-        perm_order = list(range(q_length))  # 建立索引列表 [0,1,2,3,4,5,6]
-        rng.shuffle(perm_order)             # 打亂順序，例如 [3,0,5,1,6,2,4]
-        
-        # 步驟 4：用置換順序重新排列 Q
         # 例如 Q = [1,4,2,7,5,3,6], perm_order = [3,0,5,1,6,2,4]
         #      新 Q = [Q[3], Q[0], Q[5], Q[1], Q[6], Q[2], Q[4]]
         #           = [7, 1, 3, 4, 6, 2, 5]
+        perm_order = generate_contact_permutation(contact_key, q_length)
         Q = [Q[i] for i in perm_order]
     
     return Q
@@ -140,3 +168,72 @@ def apply_Q_three_rounds(averages_21, Q):
     
     reordered_all = round1 + round2 + round3
     return reordered_all
+
+def generate_Q_batch(blocks, q_length=7, contact_key=None):
+    """
+    功能:
+        一次為多個 8×8 區塊生成排列密鑰 Q（generate_Q_from_block 的批次版）
+    
+    參數:
+        blocks: 形狀 (N, 8, 8) 的灰階區塊或 (N, 8, 8, 3) 的彩色區塊
+        q_length: Q 的長度，預設 7
+        contact_key: 對象專屬密鑰（字串），用於區分不同對象
+    
+    返回:
+        Q: 形狀 (N, q_length) 的 numpy array，每一列是一個區塊的 Q（1-based 索引）
+    
+    原理:
+        和 generate_Q_from_block 相同，只是對所有區塊的第一行一次排序
+        contact_key 的置換順序與區塊內容無關，所有區塊共用同一個
+    """
+    blocks = np.asarray(blocks)
+    
+    # 取每個區塊的第一行（彩色區塊需轉灰階）
+    if len(blocks.shape) == 4:  # 彩色區塊
+        first_rows = (
+            0.299 * blocks[:, 0, :, 0] + 
+            0.587 * blocks[:, 0, :, 1] + 
+            0.114 * blocks[:, 0, :, 2]
+        ).astype(np.float64)
+    else:  # 灰階區塊
+        first_rows = blocks[:, 0, :].astype(np.float64)
+    
+    # 只取前 q_length 個像素，逐列取得由小到大排序的索引，並轉成 1-based
+    Q = np.argsort(first_rows[:, :q_length], axis=1) + 1
+    
+    # 用 contact_key 對每個 Q 進行相同的額外置換
+    if contact_key:
+        perm_order = generate_contact_permutation(contact_key, q_length)
+        Q = Q[:, perm_order]
+    
+    return Q
+
+def apply_Q_three_rounds_batched(averages, Q):
+    """
+    功能:
+        一次對多個區塊的 21 個平均值進行 3 輪 Q 排列（apply_Q_three_rounds 的批次版）
+    
+    參數:
+        averages: 形狀 (N, 21) 的 numpy array
+        Q: 形狀 (N, 7) 的 numpy array（1-based 索引）
+    
+    返回:
+        reordered: 形狀 (N, 21) 的 numpy array，重新排列後的平均值
+    
+    原理:
+        把每列 21 個平均值排成 (3, 7)，3 輪都用同一列的 Q 取值
+    """
+    averages = np.asarray(averages)
+    Q = np.asarray(Q)
+    
+    if averages.shape[1] != 21:
+        raise ValueError(f"必須提供 21 個平均值，但收到 {averages.shape[1]} 個")
+    if Q.shape[1] != 7:
+        raise ValueError(f"Q 的長度必須是 7，但收到 {Q.shape[1]} 個")
+    
+    num_blocks = averages.shape[0]
+    rounds = averages.reshape(num_blocks, 3, 7)    # 3 輪，每輪 7 個
+    indices = (Q - 1)[:, np.newaxis, :]            # Q 是 1-based，轉成 0-based，3 輪共用
+    reordered = np.take_along_axis(rounds, indices, axis=2)
+    
+    return reordered.reshape(num_blocks, 21)
@@ -2,10 +2,50 @@
 # 處理文字和圖像的二進位轉換
 
 import numpy as np
-import math
 import hashlib
 from PIL import Image
 
+from config import KEYSTREAM_ALGORITHM
+from binary_operations import binary_to_int
+
+# XOR 密鑰流
+def generate_keystream(key, num_bytes, algorithm=KEYSTREAM_ALGORITHM):
+    """
+    功能:
+        用 key 生成指定長度的密鑰流
+    
+    參數:
+        key: 密鑰字串
+        num_bytes: 需要的密鑰流長度（bytes）
+        algorithm: 'sha256'、'shake_128' 或 'blake3'（預設使用 config.KEYSTREAM_ALGORITHM）
+    
+    返回:
+        keystream: 長度為 num_bytes 的 bytes
+    
+    原理:
+        'sha256': SHA-256 每次產生 32 bytes (256 bits)，不夠就重複 hash
+        'shake_128': SHAKE-128 是可變長度輸出的 hash，一次呼叫就產生 num_bytes 個 bytes
+        'blake3': BLAKE3 同樣可一次產生任意長度輸出，且內部以 SIMD 平行計算（需安裝 blake3 套件）
+    """
+    if algorithm == 'shake_128':
+        return hashlib.shake_128(key.encode()).digest(num_bytes)
+    
+    if algorithm == 'blake3':
+        import blake3  # 選用套件，只有使用時才載入
+        return blake3.blake3(key.encode()).digest(length=num_bytes)
+    
+    if algorithm != 'sha256':
+        raise ValueError(f"不支援的密鑰流演算法: {algorithm}")
+    
+    keystream = bytearray()
+    key_hash = hashlib.sha256(key.encode()).digest()  # 把 key 轉成 32 bytes 的 hash，例如 "Alice" → 32 bytes
+    
+    while len(keystream) < num_bytes:
+        keystream.extend(key_hash)
+        key_hash = hashlib.sha256(key_hash).digest()  # 不夠就再 hash 一次，產生更多 bytes
+    
+    return bytes(keystream[:num_bytes])
+
 # XOR 加解密（加密和解密通用）
 def xor_cipher(bits, key):
     """
@@ -13,11 +53,11 @@ def xor_cipher(bits, key):
         用 key 對 bits 進行 XOR 運算（加密/解密通用）
     
     參數:
-        bits: 要處理的位元列表
+        bits: 要處理的位元列表或 numpy array
         key: 密鑰字串
     
     返回:
-        result_bits: 運算後的位元列表
+        result_bits: 運算後的位元 uint8 numpy array
 
     原理:
         XOR 運算：相同為 0，不同為 1
@@ -31,43 +71,37 @@ def xor_cipher(bits, key):
         - 密文 XOR 密鑰 = 原文
         因此加密和解密用同一個函式
     """
+    bits = np.asarray(bits, dtype=np.uint8)
+    
     if not key:  # 沒有 key 就不處理
         return bits  
     
     # 用 key 生成足夠長的密鑰流
-    # SHA-256 每次產生 32 bytes (256 bits)，不夠就重複 hash
-    key_bits = []
-    key_hash = hashlib.sha256(key.encode()).digest()                # 把 key 轉成 32 bytes 的 hash，例如 "Alice" → 32 bytes
-    
-    while len(key_bits) < len(bits):
-        for byte in key_hash:                                       # 每個 byte (0~255)
-            key_bits.extend([int(b) for b in format(byte, '08b')])  # 轉成 8 bits，例如 72 → [0,1,0,0,1,0,0,0]
-            if len(key_bits) >= len(bits):
-                break
-        key_hash = hashlib.sha256(key_hash).digest()                # 不夠就再 hash 一次，產生更多 bits
-    
-    # XOR 運算
+    num_bytes = (len(bits) + 7) // 8                      # 需要幾個 bytes 的密鑰流
+    keystream = generate_keystream(key, num_bytes)
+    
+    # XOR 運算（以 byte 為單位，每次處理 8 bits）
     # 例如: bits = [1,0,1], key_bits = [0,1,1]
     #       結果 = [1^0, 0^1, 1^1] = [1, 1, 0]
-    return [bits[i] ^ key_bits[i] for i in range(len(bits))]
+    # 先把 bits 打包成 bytes（尾端補 0），和密鑰流逐 byte XOR，再展開回 bits 並去掉補齊的部分
+    packed = np.packbits(bits)
+    packed ^= np.frombuffer(keystream, dtype=np.uint8)
+    return np.unpackbits(packed)[:len(bits)]
     
 # 文字編碼
 def text_to_binary(text):
     """
     功能:
-        將文字轉成 UTF-8 二進位列表
+        將文字轉成 UTF-8 二進位陣列
     
     參數:
         text: 要編碼的文字字串
     
     返回:
-        bits: 二進位列表
+        bits: 二進位 uint8 numpy array
     """
-    bits = []
-    
-    for byte in text.encode('utf-8'):  # 把文字轉成 bytes，例如 "H" → 72
-        for b in format(byte, '08b'):  # 把數字轉成 8 位元二進位字串，例如 72 → "01001000"
-            bits.append(int(b))        # 把字元 '0' 或 '1' 轉成數字 0 或 1
+    byte_values = np.frombuffer(text.encode('utf-8'), dtype=np.uint8)  # 把文字轉成 bytes，例如 "H" → [72]
+    bits = np.unpackbits(byte_values)                                  # 每個 byte 展開成 8 bits，例如 72 → [0,1,0,0,1,0,0,0]
     
     return bits
 
@@ -77,20 +111,20 @@ def binary_to_text(binary):
         將二進位列表轉回文字
     
     參數:
-        binary: 二進位列表
+        binary: 二進位列表或 numpy array
     
     返回:
         text: 解碼後的文字
     """
-    byte_list = []
+    bits = np.asarray(binary, dtype=np.uint8)
+    num_bytes = len(bits) // 8                                # 只取完整的 8 bits 組（不足 8 bits 的尾巴捨棄）
+    byte_values = np.packbits(bits[:num_bytes * 8])           # 每 8 bits 打包成 1 個 byte，例如 [0,1,0,0,1,0,0,0] → 72
     
-    for i in range(0, len(binary), 8):                        # 每 8 個 bits 為一組
-        byte = binary[i:i+8]                                  # 取出這一組的 8 個 bits
-        if len(byte) == 8:
-            byte_value = int(''.join(map(str, byte)), 2)      # 二進位列表 → 十進位數字，例如 [0,1,0,0,1,0,0,0] → 72
-            byte_list.append(byte_value)                      # 收集起來
+    # 全部 byte 最高位元都是 0 → 純 ASCII，不需要 UTF-8 多位元組驗證
+    if not (byte_values & 0x80).any():
+        return byte_values.tobytes().decode('ascii')
     
-    return bytes(byte_list).decode('utf-8', errors='ignore')  # bytes 轉回文字，例如 [72] → "H"
+    return byte_values.tobytes().decode('utf-8', errors='ignore')  # bytes 轉回文字，例如 [72] → "H"
 
 # 圖像編碼
 def image_to_binary(image):
@@ -102,7 +136,7 @@ def image_to_binary(image):
         image: PIL Image 物件
     
     返回:
-        binary: 二進位列表
+        binary: 二進位 uint8 numpy array
         size: 圖像尺寸 (width, height)
         mode: 圖像色彩模式
     
@@ -141,27 +175,19 @@ def image_to_binary(image):
         has_alpha = False                                      # 不保留透明
     
     # 建立 header（34 bits：原始尺寸 + 模式）
-    binary = []
-    
-    for b in format(size[0], '016b'):      # 圖像寬度 → 16 bits
-        binary.append(int(b))
-    for b in format(size[1], '016b'):      # 圖像高度 → 16 bits
-        binary.append(int(b))
-        
-    binary.append(1 if is_color else 0)    # 是否彩色 → 1 bit
-    binary.append(1 if has_alpha else 0)   # 是否透明 → 1 bit
+    # 寬、高各 16 bits，先寫成 4 bytes 再一次展開成位元
+    size_bytes = size[0].to_bytes(2, 'big') + size[1].to_bytes(2, 'big')
+    size_bits = np.unpackbits(np.frombuffer(size_bytes, dtype=np.uint8))   # 圖像寬度 + 高度 → 32 bits
+    mode_bits = np.array([1 if is_color else 0, 1 if has_alpha else 0], dtype=np.uint8)  # 是否彩色、是否透明 → 各 1 bit
     
-    # 加入像素資料
+    # 加入像素資料（直接讀取像素陣列，不建立逐像素的 Python 列表）
+    pixels = np.asarray(image, dtype=np.uint8)  # 彩色 (H, W, 通道)，灰階 (H, W)
     if is_color:
-        for px in list(image.getdata()):      # 取得所有像素，例如 (255, 128, 64)
-            channels = 4 if has_alpha else 3  # RGBA=4 個通道, RGB=3 個通道
-            for v in px[:channels]:           # 每個通道的值 (0~255)
-                for b in format(v, '08b'):    # 轉成 8 bits
-                    binary.append(int(b))
-    else:
-        for px in list(image.getdata()):      # 灰階像素，例如 128
-            for b in format(px, '08b'):       # 轉成 8 bits
-                binary.append(int(b))
+        channels = 4 if has_alpha else 3        # RGBA=4 個通道, RGB=3 個通道
+        pixels = pixels[:, :, :channels]
+    pixel_bits = np.unpackbits(pixels.ravel())  # 依像素順序，每個通道的值 (0~255) 轉成 8 bits
+    
+    binary = np.concatenate([size_bits, mode_bits, pixel_bits])
     
     return binary, size, mode
 
@@ -171,7 +197,7 @@ def binary_to_image(binary):
         將二進位列表轉回圖像
     
     參數:
-        binary: 二進位列表
+        binary: 二進位列表或 numpy array
     
     返回:
         image: PIL Image 物件
@@ -186,47 +212,33 @@ def binary_to_image(binary):
     """
     try:
         # 解析 Header（34 bits）
-        w = int(''.join(map(str, binary[0:16])), 2)   # 圖像寬度
-        h = int(''.join(map(str, binary[16:32])), 2)  # 圖像高度
+        w = binary_to_int(binary[0:16])               # 圖像寬度
+        h = binary_to_int(binary[16:32])              # 圖像高度
         is_color = binary[32]                         # 是否彩色
         has_alpha = binary[33]                        # 是否透明
-        idx = 34                                      # 從第 34 bit 開始讀像素
         
-        # 讀取像素資料
-        if is_color:
-            pixels = []
-            
-            for _ in range(w * h):                         # 讀 w×h 個像素
-                if has_alpha and idx + 32 <= len(binary):  # RGBA: 每像素 32 bits
-                    pixel = tuple(
-                        int(''.join(map(str, binary[idx+i*8:idx+(i+1)*8])), 2)
-                        for i in range(4)                  # 讀 4 個通道 (R, G, B, A)
-                    )
-                    pixels.append(pixel)                   # 收集像素
-                    idx += 32                              # 移動到下一個像素
-                elif idx + 24 <= len(binary):              # RGB: 每像素 24 bits
-                    pixel = tuple(
-                        int(''.join(map(str, binary[idx+i*8:idx+(i+1)*8])), 2)  # 讀 8 bits 轉成數字
-                        for i in range(3)                                       # 讀 3 個通道 (R, G, B)，例如 (255, 128, 64)
-                    )
-                    pixels.append(pixel)  # 收集像素
-                    idx += 24             # 移動到下一個像素
-                    
-            # 彩色
-            img = Image.new('RGBA' if has_alpha else 'RGB', (w, h))  # 建立彩色圖像
-            img.putdata(pixels[:w*h])                                # 把像素放進圖像
+        # 讀取像素資料（從第 34 bit 開始，每個通道 8 bits，一次打包成像素值）
+        channels = (4 if has_alpha else 3) if is_color else 1  # RGBA=4, RGB=3, 灰階=1 個通道
+        num_values = w * h * channels
+        pixel_bits = np.asarray(binary[34:34 + num_values * 8], dtype=np.uint8)
         
-        else:
-            pixels = []
-            
-            for i in range(w * h):                                                  # 灰階: 每像素 8 bits
-                if idx + (i+1) * 8 <= len(binary):
-                    pixel = int(''.join(map(str, binary[idx+i*8:idx+(i+1)*8])), 2)  # 讀 8 bits 轉成數字
-                    pixels.append(pixel)                                            # 收集像素，例如 128
+        # 只取完整的像素，位元不足的像素維持 0（黑色）
+        num_complete = len(pixel_bits) // (8 * channels) * channels
+        pixel_values = np.zeros(num_values, dtype=np.uint8)
+        pixel_values[:num_complete] = np.packbits(pixel_bits[:num_complete * 8])
+        
+        # RGBA 最後剩不到 32 bits 但還有 24 bits 時，讀成 RGB，透明度為 255（不透明）
+        remaining_bits = pixel_bits[num_complete * 8:]
+        if has_alpha and num_complete < num_values and len(remaining_bits) >= 24:
+            pixel_values[num_complete:num_complete + 3] = np.packbits(remaining_bits[:24])
+            pixel_values[num_complete + 3] = 255
 
-            # 灰階
-            img = Image.new('L', (w, h))  # 建立灰階圖像
-            img.putdata(pixels[:w*h])     # 把像素放進圖像
+        if is_color:
+            # 彩色：(h, w, 3) → RGB，(h, w, 4) → RGBA
+            img = Image.fromarray(pixel_values.reshape(h, w, channels))
+        else:
+            # 灰階：(h, w) → L
+            img = Image.fromarray(pixel_values.reshape(h, w))
         
         return img, (w, h), is_color
     